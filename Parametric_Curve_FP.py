@@ -1,5 +1,5 @@
 # -*- coding: utf-8 -*-
-__version__ = "2025.01.28b"
+__version__ = "2026.10.18"
 __title__ = "Parametric_Curve_FP"
 __author__ = "<TheMarkster> 2021, based on macro 3D Parametric Curve by Gomez Lucio,  Modified by Laurent Despeyroux on 9th feb 2015"
 __license__ = "LGPL 2.1"
@@ -13,7 +13,14 @@ from math import *
 import statistics
 import Part
 import json
-import os, sys
+import hashlib
+import time
+import cProfile
+import tracemalloc
+import tempfile
+import threading
+import types
+import os
 import subprocess, os
 import platform
 import re
@@ -33,6 +40,9 @@ from PySide import QtGui,QtCore
 # For example, evaluate("a+b*3", {"a":1,"b":2}) evalutes to 7.  I also added some additional math functions
 # to the fn dictionary.  And user edwilliams16 at the FreeCAD forum has fixed a bug in the fnumber
 # regular expression, which was failing in cases of ".5" instead of "0.5". --Mark
+# The formulas can also be turned into a generated python function for speed (FormulaGraph.makeFunction()),
+# but that code is generated from the parsed formulas using only the whitelisted operators and fn functions,
+# never from the formula text itself, so there is still no eval() of user input.
 
 # <begin imported code from FourFN.py>
 
@@ -51,111 +61,133 @@ from PySide import QtGui,QtCore
 #
 # Copyright 2003-2019 by Paul McGuire
 #
-# ------- added by <TheMarkster> -- to fix conflict with another addon
-syspath = sys.path
-newsyspath = [sp for sp in sys.path if not "cadquery" in sp]
-sys.path = newsyspath
-import pyparsing
-import importlib
-importlib.reload(pyparsing)
-#-------------
-#from pyparsing import (
-#    pyparsing.Literal,
-#    pyparsing.Word,
-#    pyparsing.Group,
-#    pyparsing.Forward,
-#    pyparsing.alphas,
-#    pyparsing.alphanums,
-#    pyparsing.Regex,
-#    pyparsing.ParseException,
-#    pyparsing.CaselessKeyword,
-#    pyparsing.Suppress,
-#    pyparsing.delimitedList,
-#)
-#----------------
-sys.path = syspath
-# ------- end <TheMarkster> code
+# The pyparsing grammar (BNF()) has been replaced by FormulaParser, a small hand written parser
+# for the same grammar producing the same rpn stack, which avoids importing pyparsing and
+# building the grammar at startup.
 import math
 import operator
+import functools
+import itertools
+try:
+    import numpy as np #used for vectorized sampling, makeCurve() evaluates one t at a time without it
+except ImportError:
+    np = None
 
-exprStack = []
 
-
-def push_first(toks):
-    exprStack.append(toks[0])
-
-
-def push_unary_minus(toks):
-    for t in toks:
-        if t == "-":
-            exprStack.append("unary -")
-        else:
-            break
-
-
-bnf = None
-
-
-def BNF():
+class FormulaParser:
     '''
     expop   :: '^'
     multop  :: '*' | '/'
     addop   :: '+' | '-'
     integer :: ['+' | '-'] '0'..'9'+
-    atom    :: PI | E | real | fn '(' expr ')' | '(' expr ')'
+    atom    :: [addop]* ( PI | E | real | fn '(' expr [',' expr]* ')' | ident | '(' expr ')' )
     factor  :: atom [ expop factor ]*
     term    :: factor [ multop factor ]*
     expr    :: term [ addop term ]*
-    '''
-    global bnf
-    if not bnf:
-        # use pyparsing.CaselessKeyword for e and pi, to avoid accidentally matching
-        # functions that start with 'e' or 'pi' (such as 'exp'); Keyword
-        # and pyparsing.CaselessKeyword only match whole words
-        e = pyparsing.CaselessKeyword("E")
-        pi = pyparsing.CaselessKeyword("PI")
-        # fnumber = Combine(pyparsing.Word("+-"+nums, nums) +
-        #                    Optional("." + Optional(pyparsing.Word(nums))) +
-        #                    Optional(e + pyparsing.Word("+-"+nums, nums)))
-        # or use provided pyparsing_common.number, but convert back to str:
-        # fnumber = ppc.number().addParseAction(lambda t: str(t[0]))
-        #fnumber = pyparsing.Regex(r"[+-]?\d+(?:\.\d*)?(?:[eE][+-]?\d+)?")
-        fnumber = pyparsing.Regex(r'[-+]?(?:(?:\d*\.\d+)|(?:\d+\.?))(?:[Ee][+-]?\d+)?')
-        ident = pyparsing.Word(pyparsing.alphas, pyparsing.alphanums + "_$")
-
-        plus, minus, mult, div = map(pyparsing.Literal, "+-*/")
-        lpar, rpar = map(pyparsing.Suppress, "()")
-        addop = plus | minus
-        multop = mult | div
-        expop = pyparsing.Literal("^")
-
-        expr = pyparsing.Forward()
-        expr_list = pyparsing.delimitedList(pyparsing.Group(expr))
-        # add parse action that replaces the function identifier with a (name, number of args) tuple
-        def insert_fn_argcount_tuple(t):
-            fn = t.pop(0)
-            num_args = len(t[0])
-            t.insert(0, (fn, num_args))
-
-        fn_call = (ident + lpar - pyparsing.Group(expr_list) + rpar).setParseAction(
-            insert_fn_argcount_tuple
-        )
-        atom = (
-            addop[...]
-            + (
-                (fn_call | pi | e | fnumber | ident).setParseAction(push_first)
-                | pyparsing.Group(lpar + expr + rpar)
-            )
-        ).setParseAction(push_unary_minus)
 
+    parses one formula into its rpn stack, e.g. FormulaParser("a+2*t").parse() returns
+    ['a', '2', 't', '*', '+'].  Functions become (name, number of args) tuples, a leading
+    minus becomes 'unary -', and E and PI (any case) become "E" and "PI".
+    A new parser is used for each formula, so there is no shared state.
+    '''
+    fnumber = re.compile(r'[-+]?(?:(?:\d*\.\d+)|(?:\d+\.?))(?:[Ee][+-]?\d+)?')
+    ident = re.compile(r'[A-Za-z][A-Za-z0-9_$]*')
+
+    def __init__(self, s):
+        self.s = s
+        self.loc = 0
+        self.exprStack = []
+
+    def parse(self):
+        self.expr()
+        if self.peek():
+            self.error("end of text")
+        return self.exprStack
+
+    def error(self, expected):
+        found = self.s[self.loc:self.loc+10] if self.loc < len(self.s) else "end of text"
+        raise ValueError(f"Expected {expected}, found '{found}'  (at char {self.loc})")
+
+    def peek(self):
+        '''skip whitespace, returns the next character or "" at the end'''
+        while self.loc < len(self.s) and self.s[self.loc] in " \t\r\n":
+            self.loc += 1
+        return self.s[self.loc] if self.loc < len(self.s) else ""
+
+    def take(self, expected):
+        if self.peek() != expected:
+            self.error("'"+expected+"'")
+        self.loc += 1
+        return expected
+
+    def expr(self):
+        self.term()
+        while self.peek() in ("+", "-"):
+            op = self.take(self.peek())
+            self.term()
+            self.exprStack.append(op)
+
+    def term(self):
+        self.factor()
+        while self.peek() in ("*", "/"):
+            op = self.take(self.peek())
+            self.factor()
+            self.exprStack.append(op)
+
+    def factor(self):
         # by defining exponentiation as "atom [ ^ factor ]..." instead of "atom [ ^ atom ]...", we get right-to-left
         # exponents, instead of left-to-right that is, 2^3^2 = 2^(3^2), not (2^3)^2.
-        factor = pyparsing.Forward()
-        factor <<= atom + (expop + factor).setParseAction(push_first)[...]
-        term = factor + (multop + factor).setParseAction(push_first)[...]
-        expr <<= term + (addop + term).setParseAction(push_first)[...]
-        bnf = expr
-    return bnf
+        self.atom()
+        while self.peek() == "^":
+            self.take("^")
+            self.factor()
+            self.exprStack.append("^")
+
+    def atom(self):
+        signs = []
+        while self.peek() in ("+", "-"):
+            signs.append(self.take(self.peek()))
+        if self.peek() == "(":
+            self.take("(")
+            self.expr()
+            self.take(")")
+        else:
+            self.operand()
+        for sign in signs: #as in fourFn, only the minus signs before the first plus sign count
+            if sign == "-":
+                self.exprStack.append("unary -")
+            else:
+                break
+
+    def operand(self):
+        m = self.ident.match(self.s, self.loc)
+        if m:
+            self.loc = m.end()
+            if self.peek() == "(": #function call, the args are pushed first, then (name, number of args)
+                self.take("(")
+                num_args = 1
+                self.expr()
+                while self.peek() == ",":
+                    self.take(",")
+                    self.expr()
+                    num_args += 1
+                self.take(")")
+                self.exprStack.append((m.group(), num_args))
+            elif m.group().upper() in ("E", "PI"):
+                self.exprStack.append(m.group().upper())
+            else:
+                self.exprStack.append(m.group())
+            return
+        m = self.fnumber.match(self.s, self.loc)
+        if not m:
+            self.error("a number, variable, function, or '('")
+        self.loc = m.end()
+        self.exprStack.append(m.group())
+
+
+def parseFormula(s):
+    '''parse s and return its rpn stack, raises ValueError'''
+    return FormulaParser(s).parse()
 
 
 # map operator symbols to corresponding arithmetic operations
@@ -229,6 +261,175 @@ fn = {
     "prod": lambda *a: math.prod(a),
 }
 
+# elementwise (numpy) versions of the fn functions, used when evaluating a formula for all
+# values of t at once.  Functions missing here, such as factorial or median, have no array
+# form, and formulas using them are evaluated one t at a time instead
+vfn = {} if not np else {
+    "sin": np.sin,
+    "sinh": np.sinh,
+    "cos": np.cos,
+    "cosh": np.cosh,
+    "tan": np.tan,
+    "tanh": np.tanh,
+    "exp": np.exp,
+    "atan": np.arctan,
+    "atanh": np.arctanh,
+    "acos": np.arccos,
+    "acosh": np.arccosh,
+    "asin": np.arcsin,
+    "asinh": np.arcsinh,
+    "sqrt": np.sqrt,
+    "ceil": np.ceil,
+    "floor": np.floor,
+    "log": lambda a, *b: np.log(a) / np.log(b[0]) if b else np.log(a),
+    "abs": np.abs,
+    "degrees": np.degrees,
+    "degree": np.degrees,
+    "deg": np.degrees,
+    "radians": np.radians,
+    "rad": np.radians,
+    "trunc": np.trunc,
+    "round": np.round,
+    "sgn": lambda a: np.where(a < -epsilon, -1, np.where(a > epsilon, 1, 0)),
+    # functionsl with multiple arguments
+    "copysign": np.copysign,
+    "multiply": lambda a, b: a * b,
+    "mod": np.mod,
+    "interval": lambda a, b, t: 1 * ((t >= a) & (t < b)),
+    "lt":lambda a, b: 1 * (a < b),
+    "lte": lambda a, b: 1 * (a <= b),
+    "gt": lambda a, b: 1 * (a > b),
+    "gte": lambda a, b: 1 * (a >= b),
+    "isequal": lambda a, b: 1 * (a == b),
+    "isclose": lambda a, b: 1 * (np.abs(a - b) <= np.maximum(1e-9 * np.maximum(np.abs(a), np.abs(b)), 1e-9)),
+    "isclosetol": lambda a, b, tol: 1 * (np.abs(a - b) <= np.maximum(1e-9 * np.maximum(np.abs(a), np.abs(b)), tol)),
+    "floordiv": np.floor_divide,
+    "atan2": np.arctan2,
+    "hypot": lambda *a: functools.reduce(np.hypot, a, 0.0),
+    "ternary": lambda a, b, c: np.where(a != 0, b, c),
+    # functions with a variable number of arguments
+    "any": lambda *a: 1 * functools.reduce(np.logical_or, a, False),
+    "all": lambda *a: 1 * functools.reduce(np.logical_and, a, True),
+    "sum": lambda *a: functools.reduce(operator.add, a, 0),
+    "avg": lambda *a: functools.reduce(operator.add, a, 0)/float(len(a)),
+    "mean": lambda *a: functools.reduce(operator.add, a, 0)/float(len(a)),
+    "prod": lambda *a: functools.reduce(operator.mul, a, 1),
+}
+
+# partial derivatives of the fn functions, one for each argument, used by FormulaGraph to
+# differentiate the formulas with respect to t.  Functions that are piecewise constant, like
+# floor or lt, have 0 derivatives (except exactly at their steps).  Functions missing here,
+# such as gamma or median, cannot be differentiated
+_dfnFlat = lambda *a: (0.0,)*len(a)
+dfn = {
+    "sin": lambda a: (math.cos(a),),
+    "sinh": lambda a: (math.cosh(a),),
+    "cos": lambda a: (-math.sin(a),),
+    "cosh": lambda a: (math.sinh(a),),
+    "tan": lambda a: (1 + math.tan(a)**2,),
+    "tanh": lambda a: (1 - math.tanh(a)**2,),
+    "exp": lambda a: (math.exp(a),),
+    "atan": lambda a: (1 / (1 + a*a),),
+    "atanh": lambda a: (1 / (1 - a*a),),
+    "acos": lambda a: (-1 / math.sqrt(1 - a*a),),
+    "acosh": lambda a: (1 / math.sqrt(a*a - 1),),
+    "asin": lambda a: (1 / math.sqrt(1 - a*a),),
+    "asinh": lambda a: (1 / math.sqrt(a*a + 1),),
+    "sqrt": lambda a: (0.5 / math.sqrt(a),),
+    "ceil": _dfnFlat,
+    "floor": _dfnFlat,
+    "log": lambda a, *b: (1 / (a * math.log(b[0])), -math.log(a) / (b[0] * math.log(b[0])**2)) if b else (1 / a,),
+    "abs": lambda a: (math.copysign(1, a),),
+    "degrees": lambda a: (180 / math.pi,),
+    "degree": lambda a: (180 / math.pi,),
+    "deg": lambda a: (180 / math.pi,),
+    "radians": lambda a: (math.pi / 180,),
+    "rad": lambda a: (math.pi / 180,),
+    "trunc": _dfnFlat,
+    "round": _dfnFlat,
+    "sgn": _dfnFlat,
+    # functionsl with multiple arguments
+    "copysign": lambda a, b: (math.copysign(1, a) * math.copysign(1, b), 0.0),
+    "multiply": lambda a, b: (b, a),
+    "mod": lambda a, b: (1.0, -(a // b)),
+    "interval": _dfnFlat,
+    "lt": _dfnFlat,
+    "lte": _dfnFlat,
+    "gt": _dfnFlat,
+    "gte": _dfnFlat,
+    "isequal": _dfnFlat,
+    "isclose": _dfnFlat,
+    "isclosetol": _dfnFlat,
+    "floordiv": _dfnFlat,
+    "atan2": lambda a, b: (b / (a*a + b*b), -a / (a*a + b*b)),
+    "hypot": lambda *a: tuple(x / math.hypot(*a) for x in a),
+    "ternary": lambda a, b, c: (0.0, 1.0, 0.0) if a else (0.0, 0.0, 1.0),
+    # functions with a variable number of arguments
+    "any": _dfnFlat,
+    "all": _dfnFlat,
+    "sum": lambda *a: (1.0,)*len(a),
+    "avg": lambda *a: (1.0 / len(a),)*len(a),
+    "mean": lambda *a: (1.0 / len(a),)*len(a),
+    "gmean": lambda *a: tuple(statistics.geometric_mean(a) / (len(a) * x) for x in a),
+    "hmean": lambda *a: tuple(statistics.harmonic_mean(a)**2 / (len(a) * x * x) for x in a),
+    "stdev": lambda *a: tuple((x - statistics.mean(a)) / ((len(a) - 1) * statistics.stdev(a)) for x in a),
+    "prod": lambda *a: tuple(math.prod(a[:i] + a[i+1:]) for i in range(len(a))),
+}
+
+# second partial derivatives of the fn functions, for FormulaGraph.makeFunction(2).  Each gives
+# the hessian as a tuple of rows, one row and one column for each argument, e.g. ((-sin(a),),)
+# for sin(a).  Functions missing here cannot be differentiated twice.
+def _d2fnUnary(f2):
+    return lambda a: ((f2(a),),)
+_d2fnZeros = lambda *a: ((0.0,)*len(a),)*len(a)
+def _hypotHessian(*a):
+    h = math.hypot(*a)
+    return tuple(tuple(((h*h if i == j else 0.0) - x*y) / h**3 for j,y in enumerate(a)) for i,x in enumerate(a))
+def _logHessian(a, *b):
+    if not b:
+        return ((-1 / (a*a),),)
+    lb = math.log(b[0])
+    return ((-1 / (a*a*lb), -1 / (a*b[0]*lb*lb)), (-1 / (a*b[0]*lb*lb), math.log(a) * (lb + 2) / (b[0]**2 * lb**3)))
+def _atan2Hessian(a, b):
+    r4 = (a*a + b*b)**2
+    return ((-2*a*b / r4, (a*a - b*b) / r4), ((a*a - b*b) / r4, 2*a*b / r4))
+def _gmeanHessian(*a):
+    g, n = statistics.geometric_mean(a), len(a)
+    return tuple(tuple(g / (n*n*x*y) - (g / (n*x*x) if i == j else 0.0) for j,y in enumerate(a)) for i,x in enumerate(a))
+def _hmeanHessian(*a):
+    h, n = statistics.harmonic_mean(a), len(a)
+    return tuple(tuple(2*h**3 / (n*n*x*x*y*y) - (2*h*h / (n*x**3) if i == j else 0.0) for j,y in enumerate(a)) for i,x in enumerate(a))
+def _stdevHessian(*a):
+    s, m, n = statistics.stdev(a), statistics.mean(a), len(a)
+    return tuple(tuple(((1.0 if i == j else 0.0) - 1 / n) / ((n - 1) * s) - (x - m) * (y - m) / ((n - 1)**2 * s**3) for j,y in enumerate(a)) for i,x in enumerate(a))
+def _prodHessian(*a):
+    return tuple(tuple(0.0 if i == j else math.prod(a[k] for k in range(len(a)) if k != i and k != j) for j in range(len(a))) for i in range(len(a)))
+d2fn = {
+    "sin": _d2fnUnary(lambda a: -math.sin(a)),
+    "sinh": _d2fnUnary(math.sinh),
+    "cos": _d2fnUnary(lambda a: -math.cos(a)),
+    "cosh": _d2fnUnary(math.cosh),
+    "tan": _d2fnUnary(lambda a: 2 * math.tan(a) * (1 + math.tan(a)**2)),
+    "tanh": _d2fnUnary(lambda a: -2 * math.tanh(a) * (1 - math.tanh(a)**2)),
+    "exp": _d2fnUnary(math.exp),
+    "atan": _d2fnUnary(lambda a: -2*a / (1 + a*a)**2),
+    "atanh": _d2fnUnary(lambda a: 2*a / (1 - a*a)**2),
+    "acos": _d2fnUnary(lambda a: -a / (1 - a*a)**1.5),
+    "acosh": _d2fnUnary(lambda a: -a / (a*a - 1)**1.5),
+    "asin": _d2fnUnary(lambda a: a / (1 - a*a)**1.5),
+    "asinh": _d2fnUnary(lambda a: -a / (a*a + 1)**1.5),
+    "sqrt": _d2fnUnary(lambda a: -0.25 / a**1.5),
+    "log": _logHessian,
+    "atan2": _atan2Hessian,
+    "hypot": _hypotHessian,
+    "multiply": lambda a, b: ((0.0, 1.0), (1.0, 0.0)),
+    "gmean": _gmeanHessian,
+    "hmean": _hmeanHessian,
+    "stdev": _stdevHessian,
+    "prod": _prodHessian,
+}
+d2fn.update({op: _d2fnZeros for op in dfn if not op in d2fn}) #the rest are linear or piecewise linear
+
 
 def evaluate_stack(s,vars):
     op, num_args = s.pop(), 0
@@ -267,43 +468,525 @@ def evaluate_stack(s,vars):
 # evaluate("a+b",vars) thus returns 3 --Mark
 
 def evaluate(s, vars={}):
-    if s == "": #return 0 in case the user has left the field blank --Mark
-        return 0
-    s= checkForFCEval(s)
-
-
-    exprStack[:] = []
+    program = compileFormula(s)
     try:
-        results = BNF().parseString(s, parseAll=True)
-        val = evaluate_stack(exprStack[:],vars)
-    except pyparsing.ParseException as pe:
-        raise Exception(s, "failed parse:", str(pe))
+        val = evaluateProgram(program,vars)
     except Exception as e:
-        raise Exception (s, "failed eval:", str(e), exprStack)
+        raise Exception (s, "failed eval:", str(e), program)
     else:
         return val
 
+# compileFormula() parses the formula string once and returns its program (the rpn stack),
+# which evaluateProgram() can then evaluate any number of times with different vars
+# without parsing the string again.  makeCurve() uses this to avoid re-parsing every
+# formula for every value of t
+
+def compileFormula(s, obj=None, fcValues=None):
+    if s == "": #return 0 in case the user has left the field blank --Mark
+        return Program(["0"])
+    s= checkForFCEval(s,obj,fcValues)
+
+    try:
+        return Program(parseFormula(s))
+    except ValueError as pe:
+        raise Exception(s, "failed parse:", str(pe))
+
+# evaluateProgram() used to call evaluate_stack(), which recurses once for every token, so long
+# formulas, such as polynomial fits with hundreds of terms, were slow and could reach python's
+# recursion limit.  Now each program is decoded once by decodeProgram(), with the numbers already
+# converted and the operators and functions already looked up, and runProgram() evaluates it in a
+# loop with its own stack.  The values are the same as evaluate_stack() gives.
+
+class Program(list):
+    '''rpn stack from parseFormula(), keeps its decoded form once evaluateProgram() has made it'''
+    code = None
+    calls = () #names of the functions called with arguments
+
+NUMBER, NEGATE, OPERATOR, NAME, INVALID = range(5)
+
+def decodeProgram(program):
+    '''returns the list of decoded tokens for runProgram()'''
+    code = []
+    for op in program:
+        num_args = 0
+        if isinstance(op, tuple):
+            op, num_args = op
+        if op == "unary -":
+            code.append((NEGATE,))
+        elif op in "+-*/^":
+            code.append((OPERATOR, opn[op]))
+        elif op == "PI":
+            code.append((NUMBER, math.pi))
+        elif op == "E":
+            code.append((NUMBER, math.e))
+        elif op[0].isalpha():
+            #vars are looked up first when running, in case a variable has the name of a function
+            code.append((NAME, op, fn.get(op), num_args))
+        else:
+            try:
+                code.append((NUMBER, int(op)))
+            except ValueError:
+                try:
+                    code.append((NUMBER, float(op)))
+                except ValueError as e:
+                    code.append((INVALID, e)) #raised only if evaluated, as before
+    return code
+
+def runProgram(code, vars):
+    '''evaluate the decoded tokens from decodeProgram()'''
+    stack = []
+    push = stack.append
+    pop = stack.pop
+    for token in code:
+        kind = token[0]
+        if kind == NUMBER:
+            push(token[1])
+        elif kind == OPERATOR:
+            op2 = pop()
+            stack[-1] = token[1](stack[-1], op2)
+        elif kind == NAME:
+            if token[1] in vars:
+                push(vars[token[1]])
+            elif token[2]:
+                num_args = token[3]
+                if num_args > len(stack):
+                    raise IndexError("pop from empty list")
+                args = stack[len(stack)-num_args:]
+                del stack[len(stack)-num_args:]
+                push(token[2](*args))
+            else:
+                raise Exception("invalid identifier '%s'" % token[1])
+        elif kind == NEGATE:
+            stack[-1] = -stack[-1]
+        else:
+            raise token[1]
+    return stack[-1]
+
+def evaluateProgram(program, vars={}):
+    if not isinstance(program, Program):
+        program = Program(program)
+    if program.code is None:
+        program.code = decodeProgram(program)
+        program.calls = tuple({op[0] for op in program if isinstance(op, tuple) and op[1]})
+    for name in program.calls:
+        if name in vars:
+            #a variable with the name of a function, e.g. sin(t) with vars["sin"], returns the variable
+            #without using up the arguments, which only the recursive evaluator does the same way
+            return evaluate_stack(program[:],vars)
+    return runProgram(program.code, vars)
+
+def programVariables(program):
+    '''returns the set of variable names referenced in program'''
+    names = {op for op in program if isinstance(op, str) and op[0].isalpha() and not op in ("unary -", "PI", "E")}
+    return names | {op[0] for op in program if isinstance(op, tuple) and not op[0] in fn}
+
 # implement FreeCAD.DocumentObject.evalExpression(str)
 # usage: fc(freecad_expression_string)
-
-def checkForFCEval(s):
-    if "fc(" in s:
-        idx = s.index("fc(")
-        idx2 = s.index(")",idx)+1
-        fc_Total = s[idx:idx2] #example fc(dd.ddFloat)
-        fc_Eval = fc_Total[3:-1] # example dd.ddFloat
-        if "fc(" in fc_Eval:
-            FreeCAD.Console.PrintError("ParametricCurve::Unsupported -- Nested fc(expr) functions not supported.\n")
-        evaluated = FreeCAD.ActiveDocument.Objects[0].evalExpression(fc_Eval)
-        evaluated = evaluated.Value if hasattr(evaluated,"Value") else evaluated
-        s = s.replace(fc_Total,str(evaluated))
-        return checkForFCEval(s) #in case there are multiple fc(expr) calls in the same string
-    else:
+# fc(expr) calls are found by matching parentheses, so fc(max(Box.Length, 2)) works, and nested calls,
+# such as fc(Box.Length * fc(Sheet.factor)), are evaluated from the inside out.  obj is the document
+# object whose evalExpression() is used, and cache is an optional dictionary of expr:value, which
+# Curve.execute() uses so each expression is evaluated only once per recompute.
+
+fcCall = re.compile(r"(?<![\w.])fc\(")
+
+def fcReferences(s):
+    '''returns a list of (start, end) indices of the outermost fc(expr) calls in s'''
+    refs = []
+    match = fcCall.search(s)
+    while match:
+        depth = 0
+        for idx in range(match.end()-1,len(s)):
+            if s[idx] == "(":
+                depth += 1
+            elif s[idx] == ")":
+                depth -= 1
+                if depth == 0:
+                    break
+        else:
+            raise ValueError(f"Unbalanced parentheses in {s[match.start():]}")
+        refs.append((match.start(),idx+1))
+        match = fcCall.search(s,idx+1)
+    return refs
+
+def checkForFCEval(s, obj=None, cache=None):
+    refs = fcReferences(s)
+    if not refs:
         return s
+    pieces = []
+    last = 0
+    for start,end in refs:
+        fc_Eval = checkForFCEval(s[start+3:end-1],obj,cache) # example dd.ddFloat
+        if cache is not None and fc_Eval in cache:
+            evaluated = cache[fc_Eval]
+        else:
+            if obj is None: #only on a cache miss, so background threads never touch the document
+                obj = FreeCAD.ActiveDocument.Objects[0]
+            evaluated = obj.evalExpression(fc_Eval)
+            evaluated = evaluated.Value if hasattr(evaluated,"Value") else evaluated
+            if cache is not None:
+                cache[fc_Eval] = evaluated
+        pieces.extend([s[last:start],str(evaluated)])
+        last = end
+    pieces.append(s[last:])
+    return "".join(pieces)
 
 # <end imported code from FourFn.py>
 
 
+class FormulaGraph:
+    '''The compiled formulas of a curve that depend on t, combined into one list of nodes.
+    Literal arithmetic, such as 2*pi or 1/3, and anything else calculated only from constants
+    is folded into a single value, and identical subexpressions, such as cos(t) used in both
+    X and Y, become a single node shared by all the formulas that use it.  So each is only
+    calculated once for each value of t.  Raises ValueError if the formulas cannot be combined,
+    e.g. if a variable is used before it is set.'''
+
+    def __init__(self, programs, constants={}):
+        self.values = [None] #node values, known in advance for constants, node 0 is t
+        self.ops = [None] #(function, numpy function or None, argument nodes, operator or fn name), None for constants
+        self.keys = {("t",):0}
+        self.results = {} #variable name: node
+        self.steps = [] #(k, value, nodes to calculate, result node) in the order a, b, c, d1..dN, X, Y, Z
+        self.tokens = 0 #nodes before optimizing (the length of all the rpn stacks)
+        self.folded = 0
+        self.shared = 0
+        self.constants = constants
+        self.function = None #makeFunction(), returning X, Y, Z
+        self.functions = {} #(order, branches): makeFunction(order, branches)
+        for k,value,program in programs:
+            first = len(self.ops)
+            stack = []
+            for op in program: #the rpn stack in order, operands come before their operators
+                self.tokens += 1
+                if isinstance(op, tuple):
+                    op, num_args = op
+                    if not op in fn:
+                        raise ValueError("invalid function '%s'" % op)
+                    args = tuple(stack[len(stack)-num_args:])
+                    del stack[len(stack)-num_args:]
+                    stack.append(self.node(("fn",op)+args, fn[op], vfn.get(op), args))
+                elif op == "unary -":
+                    arg = stack.pop()
+                    stack.append(self.node(("neg",arg), operator.neg, operator.neg, (arg,)))
+                elif op in "+-*/^":
+                    op2 = stack.pop()
+                    op1 = stack.pop()
+                    stack.append(self.node((op,op1,op2), opn[op], opn[op], (op1,op2)))
+                elif op == "PI":
+                    stack.append(self.constant(math.pi))
+                elif op == "E":
+                    stack.append(self.constant(math.e))
+                elif op == "t":
+                    stack.append(0)
+                elif op in constants:
+                    stack.append(self.constant(constants[op]))
+                elif op in self.results:
+                    stack.append(self.results[op])
+                elif op[0].isalpha():
+                    raise ValueError("'%s' used before it is set" % op)
+                else:
+                    try:
+                        stack.append(self.constant(int(op)))
+                    except ValueError:
+                        stack.append(self.constant(float(op)))
+            if len(stack) != 1:
+                raise ValueError("invalid formula for "+k)
+            self.results[k] = stack.pop()
+            self.steps.append((k,value,[i for i in range(first,len(self.ops)) if self.ops[i]],self.results[k]))
+
+    def constant(self, value):
+        '''returns the node holding value'''
+        key = ("const",type(value).__name__,repr(value))
+        if not key in self.keys:
+            self.keys[key] = len(self.ops)
+            self.ops.append(None)
+            self.values.append(value)
+        return self.keys[key]
+
+    def node(self, key, func, vfunc, args):
+        '''returns the node calculating func(*args), folded into a constant if all its arguments
+        are constants, or an identical node already in the graph if there is one'''
+        if key in self.keys:
+            self.shared += 1
+            return self.keys[key]
+        if all(a and not self.ops[a] for a in args):
+            try:
+                self.keys[key] = self.constant(func(*[self.values[a] for a in args]))
+                self.folded += 1
+                return self.keys[key]
+            except Exception:
+                pass #leave it to be reported when evaluated in the loop
+        self.keys[key] = len(self.ops)
+        self.ops.append((func,vfunc,args,key[1] if key[0] == "fn" else key[0]))
+        self.values.append(None)
+        return self.keys[key]
+
+    # which branch a piecewise function takes, for makeFunction(branches=True).  The curve may
+    # jump or have a kink where one of these changes.  {v} is the node, {a0}, {a1} its arguments
+    branchOf = {"lt":"{v}", "lte":"{v}", "gt":"{v}", "gte":"{v}", "interval":"{v}", "any":"{v}", "all":"{v}",
+                "floor":"{v}", "ceil":"{v}", "trunc":"{v}", "round":"{v}", "sgn":"{v}", "floordiv":"{v}",
+                "mod":"{a0} // {a1}", "abs":"{a0} >= 0", "copysign":"({a0} >= 0) + 2*({a1} >= 0)", "ternary":"{a0} != 0"}
+
+    def makeFunction(self, order=0, branches=False):
+        '''Generate and compile a python function returning X, Y, Z for one value of t, one line
+        per node, e.g. "v5 = fn_cos(v4)".  No text from the formulas goes into the generated code:
+        names are made from node numbers, constants are passed in the namespace, and only the
+        operators in opn, unary minus, and the functions in fn are allowed, so this is not eval()
+        of the formulas.  The namespace has no builtins.  Raises ValueError for anything else.
+        With order=1 it also returns dX/dt, dY/dt, dZ/dt, and with order=2 also the second
+        derivatives, calculated alongside the values by forward mode automatic differentiation,
+        e.g. "d5 = p5[0]*d4" where p5 = dfn_cos(v4).  This goes through a, b, c and d like the
+        values do.  Raises ValueError naming the function and formula if a function used with t
+        in its arguments has no derivative in dfn.  With branches=True a tuple of the branches
+        taken by the piecewise functions in branchOf that depend on t is also returned.'''
+        if (order,branches) in self.functions:
+            return self.functions[(order,branches)]
+        pyop = {"+":"+", "-":"-", "*":"*", "/":"/", "^":"**"}
+        namespace = {"__builtins__":{}, "math_log":math.log}
+        varying = {0} #nodes that depend on t, the derivatives of the others are 0
+        formulas = {} #node: the formula it was first made for, for errors
+        for k,value,nodes,result in self.steps:
+            for i in nodes:
+                formulas.setdefault(i,value)
+        def name(i):
+            return "t" if i == 0 else "v%d" % i if self.ops[i] else "c%d" % i
+        def dname(i, n=1):
+            return ("1.0" if n == 1 else None) if i == 0 else "%s%d" % ("d" if n == 1 else "e",i) if i in varying else None
+        lines = ["def formulas(t):"]
+        branchNames = []
+        for i,node in enumerate(self.ops):
+            if i == 0:
+                continue
+            if not node:
+                namespace[name(i)] = self.values[i]
+                continue
+            func,vfunc,args,op = node
+            argnames = [name(a) for a in args]
+            if op in opn and func is opn[op] and len(args) == 2:
+                lines.append(f"    v{i} = {argnames[0]} {pyop[op]} {argnames[1]}")
+            elif op == "neg" and func is operator.neg and len(args) == 1:
+                lines.append(f"    v{i} = -{argnames[0]}")
+            elif op in fn and func is fn[op] and op.isidentifier():
+                namespace["fn_"+op] = func
+                lines.append(f"    v{i} = fn_{op}({', '.join(argnames)})")
+            else:
+                raise ValueError("cannot generate code for '%s'" % op)
+            if any(a in varying for a in args):
+                if order and op in fn and not (op in dfn and (order < 2 or op in d2fn)):
+                    raise ValueError(f"{op}() has no derivative, used in {formulas.get(i,'?')}")
+                if order:
+                    lines.extend(self.derivativeLines(i,op,args,order,name,dname,namespace))
+                if branches and op in self.branchOf:
+                    lines.append(f"    b{i} = " + self.branchOf[op].format(v=name(i),**{"a%d" % k:a for k,a in enumerate(argnames)}))
+                    branchNames.append(f"b{i}")
+                varying.add(i)
+        outputs = []
+        for k in ("X","Y","Z"):
+            if k in self.results:
+                outputs.append(name(self.results[k]))
+            else:
+                namespace["out_"+k] = self.constants[k]
+                outputs.append("out_"+k)
+        for n in range(1,order+1):
+            outputs.extend([dname(self.results[k],n) or "0.0" if k in self.results else "0.0" for k in ("X","Y","Z")])
+        if branches:
+            outputs.append("(" + "".join(name+", " for name in branchNames) + ")")
+        lines.append("    return " + ", ".join(outputs))
+        exec(compile("\n".join(lines), "<ParametricCurve formulas>", "exec"), namespace)
+        self.functions[(order,branches)] = namespace["formulas"]
+        if not order and not branches:
+            self.function = self.functions[(order,branches)]
+        return self.functions[(order,branches)]
+
+    def derivativeLines(self, i, op, args, order, name, dname, namespace):
+        '''lines of generated code calculating d{i}, the derivative of node i with respect to t, and
+        for order 2 e{i}, the second derivative, from the values and derivatives of its arguments
+        by the chain rule.  Derivatives that are 0 are left out.'''
+        a = [name(arg) for arg in args]
+        d = [dname(arg) for arg in args]
+        e = [dname(arg,2) for arg in args]
+        v = f"v{i}"
+        def total(terms):
+            return " + ".join(term for term in terms if term) or "0.0"
+        lines = []
+        if op == "+":
+            first = total(d)
+            second = total(e)
+        elif op == "-":
+            first = total([d[0], d[1] and "-"+d[1]])
+            second = total([e[0], e[1] and "-"+e[1]])
+        elif op == "*":
+            first = total([d[0] and f"{d[0]}*{a[1]}", d[1] and f"{a[0]}*{d[1]}"])
+            second = total([e[0] and f"{e[0]}*{a[1]}", d[0] and d[1] and f"2*{d[0]}*{d[1]}", e[1] and f"{a[0]}*{e[1]}"])
+        elif op == "/": #d(a/b) = (da - a/b*db)/b
+            first = f"({total([d[0], d[1] and f'-{v}*{d[1]}'])})/{a[1]}"
+            second = f"({total([e[0], d[1] and f'-2*d{i}*{d[1]}', e[1] and f'-{v}*{e[1]}'])})/{a[1]}"
+        elif op == "^":
+            if not d[1]: #a^n
+                first = f"{a[1]}*{a[0]}**({a[1]} - 1)*{d[0]}"
+                second = total([f"{a[1]}*({a[1]} - 1)*{a[0]}**({a[1]} - 2)*{d[0]}*{d[0]}", e[0] and f"{a[1]}*{a[0]}**({a[1]} - 1)*{e[0]}"])
+            else: #a^b = exp(w), w = b*log(a)
+                lines.append(f"    w{i} = {total([f'{d[1]}*math_log({a[0]})', d[0] and f'{a[1]}*{d[0]}/{a[0]}'])}")
+                first = f"{v}*w{i}"
+                ew = total([e[1] and f"{e[1]}*math_log({a[0]})", d[0] and f"2*{d[1]}*{d[0]}/{a[0]}",
+                            d[0] and f"{a[1]}*({e[0] or '0.0'} - {d[0]}*{d[0]}/{a[0]})/{a[0]}"])
+                second = f"{v}*(w{i}*w{i} + {ew})"
+        elif op == "neg":
+            first = "-"+d[0]
+            second = e[0] and "-"+e[0] or "0.0"
+        else:
+            namespace["dfn_"+op] = dfn[op]
+            lines.append(f"    p{i} = dfn_{op}({', '.join(a)})")
+            first = total([f"p{i}[{k}]*{x}" for k,x in enumerate(d) if x])
+            if order > 1:
+                namespace["d2fn_"+op] = d2fn[op]
+                lines.append(f"    q{i} = d2fn_{op}({', '.join(a)})")
+                second = total([f"p{i}[{k}]*{x}" for k,x in enumerate(e) if x] +
+                               [f"q{i}[{j}][{k}]*{x}*{y}" for j,x in enumerate(d) if x for k,y in enumerate(d) if y])
+        lines.append(f"    d{i} = {first}")
+        if order > 1:
+            lines.append(f"    e{i} = {second}")
+        return lines
+
+    def report(self):
+        '''optimization report for debugging'''
+        nodes = sum(1 for op in self.ops if op)
+        return f"formula nodes: {self.tokens} before, {nodes} after optimizing ({self.folded} folded, {self.shared} shared)"
+
+
+
+class StageTimer:
+    '''wall time of each stage of a recompute, made only when the Timing property is True'''
+    def __init__(self):
+        self.stages = []
+        self.samples = 0 #values of t evaluated
+        self.start = self.last = time.perf_counter()
+
+    def lap(self, stage):
+        '''stage has just finished'''
+        now = time.perf_counter()
+        self.stages.append((stage,now-self.last))
+        self.last = now
+
+    def report(self):
+        '''list of strings, one per line'''
+        lines = [f"total: {(self.last-self.start)*1000:.3f} ms"]
+        lines.extend([f"{stage}: {seconds*1000:.3f} ms" for stage,seconds in self.stages])
+        lines.append(f"samples: {self.samples}")
+        evaluation = sum([seconds for stage,seconds in self.stages if stage == "evaluate"])
+        if evaluation:
+            lines.append(f"samples per second: {self.samples/evaluation:.0f}")
+        return lines
+
+class SamplingAborted(Exception):
+    '''raised by SampleErrors.add() when there are MaxErrors failed samples, or if the user stops it'''
+
+class SampleErrors:
+    '''Failed samples, reported once with the first failure and the counts per formula instead of
+    printing a message for every value of t.  With maxErrors > 0, add() raises SamplingAborted
+    when there are that many, so broken formulas fail fast.'''
+    def __init__(self, maxErrors=0):
+        self.maxErrors = maxErrors
+        self.samples = 0
+        self.count = 0
+        self.first = None #(t, formula, exception)
+        self.formulas = {} #formula: count
+
+    def add(self, t, formula, error):
+        '''formula is the "X ->..." label of the formula that raised error for t'''
+        self.count += 1
+        self.formulas[formula] = self.formulas.get(formula,0) + 1
+        if not self.first:
+            self.first = (t,formula,error)
+        if self.maxErrors and self.count >= self.maxErrors:
+            raise SamplingAborted(f"stopped after MaxErrors = {self.maxErrors} failed samples")
+
+    def report(self):
+        if not self.count:
+            return
+        t,formula,error = self.first
+        error = "division by zero" if isinstance(error,ZeroDivisionError) else str(error) or type(error).__name__
+        counts = ", ".join([f"{label.split(' ->')[0]} {count}" for label,count in self.formulas.items()])
+        FreeCAD.Console.PrintError(f"ParametricCurve: {self.count} of {self.samples} samples failed ({counts}), the first in {formula} for t={t}: {error}.  Failed samples repeat the previous point.\n")
+
+class Cancelled(Exception):
+    '''raised in a BackgroundJob when a newer recompute has started'''
+
+class BackgroundJob(threading.Thread):
+    '''samples a curve in a worker thread for Curve.startBackground()'''
+    def __init__(self, snapshot, fcValues, inputsHash):
+        super().__init__(daemon=True)
+        self.snapshot = snapshot
+        self.fcValues = fcValues
+        self.inputsHash = inputsHash
+        self.cancel = threading.Event()
+        self.points = None #None unless it finished
+        self.aborted = False #MaxErrors reached, the shape is null as in makeCurve()
+        self.ts = None #the t of each point
+        self.graph = None #for the tangents
+        self.constants = {}
+
+    def run(self):
+        curve = Curve.__new__(Curve) #its own proxy, so nothing is shared with the main thread
+        try:
+            ts,graph,points = curve.backgroundPoints(self.snapshot,self.fcValues,self.cancel)
+        except Cancelled:
+            return
+        except SamplingAborted as e:
+            FreeCAD.Console.PrintError(f"ParametricCurve: {e}, returning null shape\n")
+            self.aborted = True
+            return
+        except Exception as e:
+            FreeCAD.Console.PrintError(f"ParametricCurve: background sampling failed: {e}\n")
+            return
+        self.constants = getattr(curve,"constants",{})
+        self.ts,self.graph = ts,graph
+        self.points = points
+
+class ConsumerObserver:
+    '''document observer that touches a curve drawing its points without vertices (Curve.pointsOnly())
+    as soon as another object links to it, so the vertices are made before that object recomputes.
+    It is only installed while there are such curves, registered by update(), and only looks at
+    changes to link properties and expressions.  Each version of the module, e.g. after reloading
+    the macro, has its own observer for the curves made by its own Curve.'''
+    observer = None
+    curves = {} #FullName: curve object drawing lightweight points
+
+    @classmethod
+    def update(cls, fp, drawn):
+        '''register fp if it draws lightweight points, otherwise unregister it, then install or remove
+        the observer'''
+        key = getattr(fp,"FullName",None) or str(id(fp))
+        if drawn:
+            cls.curves[key] = fp
+        else:
+            cls.curves.pop(key,None)
+        if cls.curves and cls.observer is None and hasattr(FreeCAD,"addDocumentObserver"):
+            cls.observer = cls()
+            FreeCAD.addDocumentObserver(cls.observer)
+        elif not cls.curves and cls.observer is not None:
+            FreeCAD.removeDocumentObserver(cls.observer)
+            cls.observer = None
+
+    def slotChangedObject(self, obj, prop):
+        if prop != "ExpressionEngine" and not "Link" in obj.getTypeIdOfProperty(prop):
+            return
+        for key,curve in list(self.curves.items()):
+            try:
+                if not curve.Proxy.pointsOnly(curve):
+                    curve.touch() #setShape() unregisters it once the vertices are made
+            except Exception: #deleted meanwhile, the observer is removed by the next update() if it was the last
+                self.curves.pop(key,None)
+
+    def slotDeletedObject(self, obj):
+        if getattr(obj,"FullName",None) in self.curves:
+            self.update(obj,False)
+
+    def slotDeletedDocument(self, doc):
+        for key,curve in list(self.curves.items()):
+            if key.startswith(doc.Name+"#"):
+                self.update(curve,False)
+
 class Curve:
     def __init__(self, obj):
         obj.addExtension("Part::AttachExtensionPython")
@@ -329,12 +1012,42 @@ class Curve:
         obj.addProperty("App::PropertyFloat","t_min","Equation3(T Params)","start value for t").t_min = 0.0
         obj.addProperty("App::PropertyFloat","t_max","Equation3(T Params)","Max t").t_max = 2*pi
         obj.addProperty("App::PropertyFloat","Interval","Equation3(T Params)","Interval").Interval = 0.1
+        obj.addProperty("App::PropertyEnumeration","SampleDistribution","Equation3(T Params)","Where to put the values of t: Uniform, Chebyshev, Cosine or List (from TList)").SampleDistribution = ["Uniform","Chebyshev","Cosine","List"]
+        obj.SampleDistribution = "Uniform" #default
+        obj.addProperty("App::PropertyFloatList","TList","Equation3(T Params)","SampleDistribution List: the values of t to use, in order, instead of t_min, t_max and Interval").TList = []
+        obj.addProperty("App::PropertyEnumeration","Sampling","Equation3(T Params)","Fixed, Adaptive (more points where the curve bends) or ArcLength (equally spaced along the curve)").Sampling = ["Fixed","Adaptive","ArcLength"]
+        obj.Sampling = "Fixed" #default
+        obj.addProperty("App::PropertyFloat","Tolerance","Equation3(T Params)","Adaptive sampling: largest allowed distance between the curve and the lines joining its points").Tolerance = 0.01
+        obj.addProperty("App::PropertyFloat","AngleTolerance","Equation3(T Params)","Adaptive sampling: largest change of direction in degrees, 0 to ignore").AngleTolerance = 5.0
+        obj.addProperty("App::PropertyInteger","MaxPoints","Equation3(T Params)","Adaptive and ArcLength sampling: no more points than this").MaxPoints = 10000
+        obj.addProperty("App::PropertyInteger","PointCount","Equation3(T Params)","ArcLength sampling: number of points, 0 to use Spacing").PointCount = 0
+        obj.addProperty("App::PropertyFloat","Spacing","Equation3(T Params)","ArcLength sampling: distance along the curve between points if PointCount is 0").Spacing = 0.0
+        obj.addProperty("App::PropertyBool","Breakpoints","Equation3(T Params)","Also sample where piecewise functions such as lt or floor switch branch").Breakpoints = False
+        obj.addProperty("App::PropertyInteger","MaxErrors","Equation3(T Params)","Stop with a null shape after this many failed samples, 0 to never stop").MaxErrors = 100
         obj.addProperty("App::PropertyBool","Closed","Curve","Whether curve is closed").Closed=False
         obj.addProperty("App::PropertyBool","PlusOneIteration","Curve","Fixes a bug, but changes existing behavior.  Set to False if it breaks an existing model.").PlusOneIteration = True
+        obj.addProperty("App::PropertyBool","Vectorize","Curve","Evaluate all values of t at once with numpy").Vectorize = True
         obj.addProperty("App::PropertyVectorList","Points","Curve","Points used to make the curve. Regenerated each recompute.").Points =[]
+        obj.addProperty("App::PropertyBool","Background","Curve","Sample in a background thread so the gui does not freeze").Background = False
+        obj.addProperty("App::PropertyBool","ExportPoints","Curve","[Trigger] Write the points to a text file, x y z on each line").ExportPoints = False
+        obj.addProperty("App::PropertyBool","Timing","Timing","Time each stage of the recompute, shown in TimingReport and the report view").Timing = False
+        obj.addProperty("App::PropertyStringList","TimingReport","Timing","Time taken by each stage of the last recompute if Timing is True (readonly)")
+        obj.setEditorMode("TimingReport",1) #readonly
+        obj.addProperty("App::PropertyBool","Profile","Timing","[Trigger] Profile the next recompute, writes the results next to the document").Profile = False
         obj.addProperty("App::PropertyString","Version", "Base", "Version this object was created with").Version = __version__
         obj.addProperty("App::PropertyEnumeration","ShapeType","Curve","Options: BSpline, Polygon, Points").ShapeType=["BSpline","Polygon","Points"]
         obj.ShapeType = "BSpline" #default
+        obj.addProperty("App::PropertyEnumeration","Parameterization","Curve","BSpline shape type: interpolate each point at its value of t, or by ChordLength as before").Parameterization = ["t","ChordLength"]
+        obj.Parameterization = "t" #default
+        obj.addProperty("App::PropertyBool","Tangents","Curve","BSpline shape type: also follow the exact direction of the curve at each point").Tangents = False
+        obj.addProperty("App::PropertyBool","Approximate","Curve","BSpline shape type: fit within ApproxTolerance of the points instead of through each one").Approximate = False
+        obj.addProperty("App::PropertyFloat","ApproxTolerance","Curve","Approximate: largest allowed distance between the BSpline and the points").ApproxTolerance = 0.001
+        obj.addProperty("App::PropertyInteger","MaxDegree","Curve","Approximate: highest degree of the BSpline, 1 to 25").MaxDegree = 5
+        obj.addProperty("App::PropertyInteger","PoleCount","Curve","Number of poles of the BSpline (readonly)")
+        obj.setEditorMode("PoleCount",1) #readonly
+        obj.addProperty("App::PropertyFloat","MaxDeviation","Curve","Approximate: largest distance found between the BSpline and the points, 0 if interpolated (readonly)")
+        obj.setEditorMode("MaxDeviation",1) #readonly
+        obj.addProperty("App::PropertyBool","LightweightPoints","Curve","Points shape type: draw the points directly instead of making a vertex for each").LightweightPoints = True
         obj.addProperty("App::PropertyLink","Spreadsheet","Spreadsheet","Link a spreadsheet")
         obj.addProperty("App::PropertyBool","UpdateSpreadsheet","Spreadsheet","[Trigger] Push current formula to linked spreadsheet, creates one and links it if necessary.").UpdateSpreadsheet=False
         obj.addProperty("App::PropertyBool","UseSpreadsheet","Spreadsheet","If True, poperties are readonly and must come from spreadsheet.  If false, spreadsheet is ignored and properties are set to read/write.").UseSpreadsheet=False
@@ -364,6 +1077,20 @@ class Curve:
         self.editingMode = False
         self.fpName = obj.Name
 
+    # attributes holding results of the last recompute, not saved with the document
+    transient = ("constants","inputsHash","timer","job","pollTimer","errors")
+    progressSamples = 100000 #show progress when evaluating more samples than this
+
+    def __getstate__(self):
+        return {k:v for k,v in self.__dict__.items() if not k in self.transient}
+
+    def __setstate__(self, state):
+        if state:
+            self.__dict__.update(state)
+
+    def onDocumentRestored(self, fp):
+        ConsumerObserver.update(fp,getattr(self,"pointsDrawn",False)) #the shape saved is an empty compound
+
     def setReadOnly(self,fp,bReadOnly):
         '''if bReadOnly = True, we set the properties linked to the spreadsheet readonly, else set them normal mode'''
         if bReadOnly:
@@ -663,6 +1390,8 @@ class Curve:
     def onChanged(self, fp, prop):
         '''Do something when a property has changed'''
         doc = FreeCAD.ActiveDocument
+        if prop in ("a","b","c","d","X","Y","Z","t","t_min","t_max","Interval"):
+            self.cancelBackground() #no longer wanted, execute() will start a new one
         #FreeCAD.Console.PrintMessage("Change property: " + str(prop) + ""+chr(10))
         if prop == "Spreadsheet" and fp.Spreadsheet != None:
             self.updateFromSpreadsheet(fp)
@@ -751,12 +1480,23 @@ Use Open File to open file in external editor.\n\
                 self.updateJSON_Data(fp,fp.Formulas) #update self.JSON_Data on every property change
         elif prop == "MakeFace" and fp.MakeFace == True:
             self.bInhibitRecompute = True
-            if fp.MakeFace and fp.Shape.isClosed():
+            if fp.MakeFace and not getattr(self,"pointsDrawn",False) and fp.Shape.isClosed():
                 try:
                     face = Part.makeFace(fp.Shape,"Part::FaceMakerCheese")
                     fp.Shape = face
                 except:
                     pass
+        elif prop == "ExportPoints" and fp.ExportPoints == True:
+            fp.ExportPoints = False
+            self.bInhibitRecompute = True
+            fname = QtGui.QFileDialog.getSaveFileName(FreeCADGui.getMainWindow(),"Export points to a text file",filter='*.xyz *.txt *.*')[0]
+            if fname:
+                try:
+                    self.exportPoints(fp,fname)
+                except (OSError,SamplingAborted) as e:
+                    FreeCAD.Console.PrintError(f"ParametricCurve: unable to export points: {e}\n")
+        elif (prop == "Timing" and fp.Timing == True) or (prop == "Profile" and fp.Profile == True):
+            self.inputsHash = None #time a full recompute rather than an unchanged one
         elif prop == "EditFormulas" and fp.EditFormulas == True:
             fp.EditFormulas = False
             t = QtCore.QTimer()
@@ -776,114 +1516,849 @@ Use Open File to open file in external editor.\n\
         idx3 = strip1.index("}")
         return strip1[:idx2] + strip1[idx3+1:]
 
-    def makeCurve(self, fp):
+    def makeCurve(self, fp, fcValues=None):
+        timer = getattr(self,"timer",None)
         self.updateFromSpreadsheet(fp)
-        vars = {"a":0,"b":0,"c":0,"X":0,"Y":0,"Z":0,"t":0}
+        if timer:
+            timer.lap("spreadsheet")
+        compiled = self.compileFormulas(fp,fcValues)
+        if not compiled:
+            return Part.Shape()
+        graph,programs = compiled
+        if timer:
+            timer.lap("parse")
+        tRange = self.tRange(fp)
+        if not tRange:
+            return Part.Shape()
+        tvals = list(self.tValues(*tRange))
+        sample = lambda ts, vars=None: self.sample(fp,graph,programs,ts,vars)
+        self.errors = SampleErrors(fp.MaxErrors if hasattr(fp,"MaxErrors") else 0)
+        try:
+            if getattr(fp,"Breakpoints",False):
+                tvals = self.insertBreakpoints(graph,tvals)
+                if timer:
+                    timer.lap("breakpoints")
+            if hasattr(fp,"Sampling") and fp.Sampling != "Fixed":
+                tvals,matriz = self.resample(fp,sample,tvals)
+            elif len(tvals) > self.progressSamples:
+                matriz = self.sampleWithProgress(fp,sample,tvals)
+            else:
+                matriz = sample(tvals)
+        except SamplingAborted as e:
+            FreeCAD.Console.PrintError(f"ParametricCurve: {e}, returning null shape\n")
+            matriz = None
+        finally:
+            self.errors.report()
+            self.errors = None
+        if timer:
+            timer.lap("evaluate")
+        if matriz is None:
+            return Part.Shape()
+        return self.makeShape(fp,matriz,tvals,graph)
 
+    def sampleWithProgress(self, fp, sample, tvals, chunkSize=10000):
+        '''sample(ts, vars) a chunk at a time, showing progress in the FreeCAD progress bar'''
+        progress = FreeCAD.Base.ProgressIndicator()
+        progress.start(f"ParametricCurve: evaluating {fp.Label}",(len(tvals)+chunkSize-1)//chunkSize)
+        matriz = []
+        vars = {}
+        try:
+            for start in range(0,len(tvals),chunkSize):
+                matriz.extend(sample(tvals[start:start+chunkSize],vars))
+                try:
+                    progress.next(True)
+                except Exception: #user pressed the cancel button
+                    raise SamplingAborted("stopped by the user")
+        finally:
+            progress.stop()
+        return matriz
+
+    def makeShape(self, fp, matriz, ts=None, graph=None):
+        '''store the points in fp.Points and make the shape from them.  ts are the values of t of the
+        points and graph their FormulaGraph, if known, for interpolationHints()'''
+        timer = getattr(self,"timer",None)
+        if not matriz:
+            FreeCAD.Console.PrintWarning("ParametricCurve: --vector list is empty, returning null shape\n")
+            return Part.Shape()
+        if fp.ShapeType == "Polygon" and fp.Closed == True:
+            matriz.append(matriz[0])
+        fp.Points = matriz
+        if timer:
+            timer.lap("points")
+        if fp.ShapeType == "BSpline" and getattr(fp,"Approximate",False):
+            shape = self.approximate(fp,matriz)
+            stage = "approximate"
+        elif fp.ShapeType == "BSpline":
+            hints = self.interpolationHints(fp,matriz,ts,graph)
+            if timer and "Tangents" in hints:
+                timer.lap("tangents")
+            curve = Part.BSplineCurve()
+            curve.interpolate(matriz, PeriodicFlag=fp.Closed, **hints)
+            shape = curve.toShape()
+            stage = "interpolate"
+            if hasattr(fp,"PoleCount"):
+                fp.PoleCount = curve.NbPoles
+                fp.MaxDeviation = 0.0
+        elif fp.ShapeType == "Polygon":
+            shape = Part.makePolygon(matriz)
+            stage = "makePolygon"
+        elif self.pointsOnly(fp): #CurveVP draws fp.Points
+            shape = Part.Compound([])
+            stage = "points"
+        else: #fp.ShapeType == "Points":
+            vertices = [Part.Vertex(p) for p in fp.Points]
+            shape = Part.Compound(vertices)
+            stage = "vertices"
+        if timer:
+            timer.lap(stage)
+        return shape
+
+    def interpolationHints(self, fp, matriz, ts, graph):
+        '''keyword arguments for interpolate(): Parameters, the sampled values of t instead of the
+        chord lengths OCC uses by default, if Parameterization is "t", and Tangents, dX/dt, dY/dt,
+        dZ/dt of the formulas at each point, if Tangents is True.  So the BSpline follows the curve
+        more closely between the points and the same accuracy needs fewer of them.'''
+        hints = {}
+        if not ts or len(ts) != len(matriz) or len(ts) < 2:
+            return hints
+        if getattr(fp,"Parameterization","ChordLength") == "t":
+            params = [abs(t-ts[0]) for t in ts] #must increase, t_max may be less than t_min
+            if fp.Closed: #periodic needs the parameter of the first point again at the end
+                params.append(2*params[-1]-params[-2])
+            if all(p1 > p0 for p0,p1 in zip(params,params[1:])):
+                hints["Parameters"] = params
+            else: #e.g. a TList going back and forth
+                FreeCAD.Console.PrintWarning("ParametricCurve: Parameterization t not used, the values of t must keep increasing or keep decreasing\n")
+        if getattr(fp,"Tangents",False):
+            tangents = self.tangents(graph,ts)
+            if tangents:
+                sign = 1 if ts[-1] > ts[0] else -1
+                hints["Tangents"] = [FreeCAD.Vector(sign*dx,sign*dy,sign*dz) for dx,dy,dz in tangents]
+                hints["TangentFlags"] = [tangent.Length > 1e-12 for tangent in hints["Tangents"]] #none at cusps
+                hints["Scale"] = not "Parameters" in hints #scaled to the chord lengths
+        return hints
+
+    def tangents(self, graph, ts):
+        '''dX/dt, dY/dt, dZ/dt at each t by automatic differentiation of the formulas, or None after
+        a warning if they cannot be differentiated'''
+        if not graph:
+            FreeCAD.Console.PrintWarning("ParametricCurve: tangents not used, a variable is used before it is set\n")
+            return None
+        try:
+            function = graph.makeFunction(1)
+            return [function(t)[3:] for t in ts]
+        except Exception as e:
+            FreeCAD.Console.PrintWarning(f"ParametricCurve: tangents not used, {e}\n")
+            return None
+
+    def derivatives(self, fp, ts, order=1):
+        '''For scripts: (X, Y, Z, dX/dt, dY/dt, dZ/dt) at each value in ts, followed by the second
+        derivatives with order=2, all calculated together in one pass by automatic differentiation
+        of the formulas, through a, b, c and d.  Raises ValueError if they cannot be differentiated,
+        naming the function and formula, e.g. gamma() in X.'''
+        formulas = self.effectiveInputs(fp)["formulas"]
+        fcValues = self.resolveFCReferences(formulas,fp if hasattr(fp,"evalExpression") else None)
+        compiled = self.compileFormulas(fp,fcValues) if fcValues is not None else None
+        if not compiled:
+            raise ValueError("error in the formulas")
+        if not compiled[0]:
+            raise ValueError("cannot differentiate formulas using a variable before it is set")
+        function = compiled[0].makeFunction(order)
+        return [function(t) for t in ts]
+
+    def curvature(self, fp, ts):
+        '''For scripts: the curvature |r' x r''| / |r'|^3 at each value in ts, from derivatives(), inf
+        where the curve stops (r' = 0).  The radius of curvature is 1/curvature.'''
+        curvatures = []
+        for x,y,z,dx,dy,dz,ex,ey,ez in self.derivatives(fp,ts,2):
+            cross = math.sqrt((dy*ez-dz*ey)**2 + (dz*ex-dx*ez)**2 + (dx*ey-dy*ex)**2)
+            speed = math.sqrt(dx*dx + dy*dy + dz*dz)
+            curvatures.append(cross / speed**3 if speed else math.inf)
+        return curvatures
+
+    def approximate(self, fp, matriz):
+        '''BSpline within fp.ApproxTolerance of the points with degree at most fp.MaxDegree, sets
+        PoleCount and MaxDeviation.  Interpolates instead if OCC cannot make it.'''
+        points = list(matriz)
+        if fp.Closed and (points[-1]-points[0]).Length > 1e-7: #closed, but not periodic
+            points.append(points[0])
+        degree = max(1,min(25,fp.MaxDegree))
+        continuity = "C2" if degree >= 3 else "C1" if degree == 2 else "C0"
+        curve = Part.BSplineCurve()
+        try:
+            curve.approximate(Points=points,DegMin=min(3,degree),DegMax=degree,Tolerance=fp.ApproxTolerance,Continuity=continuity)
+        except Exception as e:
+            FreeCAD.Console.PrintWarning(f"ParametricCurve: approximation failed ({e}), interpolating instead\n")
+            curve = Part.BSplineCurve()
+            curve.interpolate(matriz, PeriodicFlag=fp.Closed)
+            points = []
+        fp.PoleCount = curve.NbPoles
+        fp.MaxDeviation = self.maxDeviation(curve,points)
+        return curve.toShape()
+
+    def maxDeviation(self, curve, points, checks=10000):
+        '''largest distance between the points and the curve, projecting at most checks of the points,
+        evenly spread, because each projection is fairly slow'''
+        step = max(1,len(points)//checks)
+        return max([(curve.value(curve.parameter(point))-point).Length for point in points[::step]],default=0.0)
+
+    def pointsOnly(self, fp):
+        '''True if the Points shape type is drawn by CurveVP from fp.Points, and the shape is an empty
+        compound.  A vertex for each point is only made if another object links to this one, groups
+        such as a Body or App::Part containing the curve do not count.'''
+        if fp.ShapeType != "Points" or not getattr(fp,"LightweightPoints",False):
+            return False
+        return not [obj for obj in getattr(fp,"InList",[]) if not (hasattr(obj,"hasExtension") and obj.hasExtension("App::GroupExtension"))]
+
+    def compileFormulas(self, fp, fcValues=None, quiet=False):
+        '''parse the formulas, evaluate those that do not depend on t into self.constants, and combine
+        the rest into a FormulaGraph.  Returns (graph, programs), where graph is None if the formulas
+        must be evaluated one by one, or None after reporting an error in a formula (unless quiet)'''
+        fcValues = {} if fcValues is None else fcValues
+        self.constants = {}
         fa = self.stripComments(fp.a)
         fb = self.stripComments(fp.b)
         fc = self.stripComments(fp.c)
         fx = self.stripComments(fp.X)
         fy = self.stripComments(fp.Y)
         fz = self.stripComments(fp.Z)
+        #parse each formula only once, then evaluate the compiled programs in the loop
+        formulas = [("a",fa,"a ->"+str(fa)), ("b",fb,"b ->"+str(fb)), ("c",fc,"c ->"+str(fc))]
+        for dd in range(0,len(fp.d)):#fp.d[0] = d1, fp.d[1] = d2, etc
+            k = "d"+str(dd+1)# where dd = 0, k = "d1"
+            formulas.append((k,self.stripComments(fp.d[dd]),k+" ->"+str(fp.d[dd])))
+        formulas.extend([("X",fx,"X ->"+str(fx)), ("Y",fy,"Y ->"+str(fy)), ("Z",fz,"Z ->"+str(fz))])
+        programs = []
+        for k,formula,value in formulas:
+            try:
+                programs.append((k,value,compileFormula(formula,fp if hasattr(fp,"evalExpression") else None,fcValues)))
+            except Exception:
+                if not quiet:
+                    FreeCAD.Console.PrintError("Error in the formula of "+value+"() !\n")
+                return None
+        #formulas that do not depend on t are evaluated only once, here
+        self.constants, programs = self.hoistConstants(programs)
+        try:
+            graph = FormulaGraph(programs,self.constants)
+            FreeCAD.Console.PrintLog(f"ParametricCurve: {graph.report()}\n")
+        except ValueError:
+            graph = None #e.g. a variable used before it is set, so evaluate formula by formula
+        return graph,programs
+
+    def tRange(self, fp):
+        '''returns (t_min, t_max, interval, count, lastIsTmax, nodes) for tValues(), or None if the interval
+        is 0.  nodes is None for the Uniform SampleDistribution, otherwise the list of values of t.'''
+        distribution = getattr(fp,"SampleDistribution","Uniform")
+        if distribution == "List":
+            nodes = list(fp.TList)
+            if not nodes:
+                FreeCAD.Console.PrintWarning("ParametricCurve: TList is empty, return null shape.\n")
+                return None
+            return nodes[0],nodes[-1],fp.Interval,len(nodes),False,nodes
         t = fp.t if hasattr(fp,"t") else fp.t_min
         tf = fp.t_max
         intv = fp.Interval
         if not intv:
             FreeCAD.Console.PrintWarning("ParametricCurve: interval must be non-zero, return null shape.\n")
-            return Part.Shape()
+            return None
         if (tf-t)*intv <= 0:
             FreeCAD.Console.PrintWarning(f"Infinite loop avoided.  t_max - t * Interval cannot be less than 0.  Interval used will be {intv * -1}\n")
             intv *= -1
         iterations = int((tf-t)/intv)
-        matriz = []
         plus1 = 1
-        if hasattr(fp,"PlusOneIteration") and fp.PlusOneIteration:
+        plusOne = hasattr(fp,"PlusOneIteration") and fp.PlusOneIteration
+        if plusOne:
             lastT = t + iterations * intv
             while lastT < tf and not math.isclose(lastT, tf, abs_tol = 1e-9): #don't add if almost equal
                 plus1 += 1
                 lastT += intv
         else:
             plus1 = 0  # restore old bug for compatibility
-        for i in range(iterations + plus1):
-            if hasattr(fp,"PlusOneIteration") and fp.PlusOneIteration:
-                if i == int(iterations) + plus1 - 1: #last iteration
-                    t = tf
+        count = iterations+plus1
+        if distribution in ("Chebyshev","Cosine"): #as many points as Uniform, always from t_min to t_max
+            n = max(count,2)
+            if distribution == "Cosine": #extremes of the Chebyshev polynomial T(n-1), including the ends
+                nodes = [-math.cos(math.pi*k/(n-1)) for k in range(n)]
+            else: #roots of T(n-2), between the ends
+                nodes = [-1.0] + [-math.cos(math.pi*(2*k+1)/(2*(n-2))) for k in range(n-2)] + [1.0]
+            nodes = [t + (tf-t)*(node+1)/2 for node in nodes]
+            nodes[-1] = tf
+            return t,tf,intv,n,True,nodes
+        return t,tf,intv,count,plusOne,None
+
+    def tValues(self, t, tf, intv, count, lastIsTmax, nodes=None):
+        '''generator of the values of t from tRange(), the last one is t_max if lastIsTmax, or the
+        nodes if the SampleDistribution is not Uniform'''
+        if nodes is not None:
+            yield from nodes
+            return
+        for i in range(count):
+            if lastIsTmax and i == count - 1: #last iteration
+                t = tf
+            yield t
+            t+=intv
+
+    def iterPoints(self, fp, chunkSize=100000, fcValues=None, cancel=None):
+        '''Generator of the points of the curve with fixed sampling, in lists of at most chunkSize points,
+        for very long curves that need not be held in memory all at once, e.g. exportPoints().  Uses
+        the properties as they are, without updating from the spreadsheet.  If cancel, a threading.Event,
+        is set, raises Cancelled before the next chunk.'''
+        compiled = self.compileFormulas(fp,fcValues)
+        tRange = self.tRange(fp)
+        if not compiled or not tRange:
+            return
+        graph,programs = compiled
+        tvals = self.tValues(*tRange)
+        vars = {} #carried from one chunk to the next, e.g. for X = Y*2 using Y from the previous t
+        self.errors = SampleErrors(getattr(fp,"MaxErrors",0))
+        try:
+            while True:
+                chunk = list(itertools.islice(tvals,chunkSize))
+                if not chunk:
+                    return
+                if cancel and cancel.is_set():
+                    raise Cancelled()
+                yield self.sample(fp,graph,programs,chunk,vars)
+        finally:
+            self.errors.report()
+            self.errors = None
+
+    def exportPoints(self, fp, fileName, chunkSize=100000):
+        '''write the points to a text file, x y z on each line, a chunk at a time from iterPoints()'''
+        count = 0
+        try:
+            with open(fileName,"w") as f:
+                for chunk in self.iterPoints(fp,chunkSize):
+                    f.write("".join([f"{p.x} {p.y} {p.z}\n" for p in chunk]))
+                    count += len(chunk)
+        except SamplingAborted:
+            os.remove(fileName) #rather than leave part of the curve
+            raise
+        FreeCAD.Console.PrintMessage(f"ParametricCurve: {count} points written to {fileName}\n")
+        return count
+
+    def hoistConstants(self, programs):
+        '''find the compiled formulas that do not depend on t, directly or through other variables,
+        and evaluate them once.  Returns (constants, programs), where constants is a dictionary,
+        e.g. {"a":1,"b":5}, and programs is what is left to evaluate for every value of t'''
+        constants = {}
+        defined = set()
+        varying = set()
+        for k,value,program in programs:
+            names = programVariables(program)
+            #t, and any name used before it is set (e.g. Y in X gives Y from the previous t) or never set
+            varying |= names - defined
+            if k in varying or names & varying:
+                varying.add(k)
+            else:
+                try:
+                    constants[k] = evaluateProgram(program,constants)
+                except Exception:
+                    varying.add(k) #let the loop report the error as usual
+            defined.add(k)
+        return constants, [p for p in programs if p[0] in varying]
+
+    def sample(self, fp, graph, programs, tvals, vars=None):
+        '''evaluate the formulas for each t in tvals the fastest way available, returns the list of points.
+        vars, if given, keeps the variables from one call to the next'''
+        if getattr(self,"timer",None):
+            self.timer.samples += len(tvals)
+        matriz = None
+        if graph and (not hasattr(fp,"Vectorize") or fp.Vectorize):
+            matriz = self.sampleVectorized(graph,tvals,self.constants)
+        if matriz is None and graph:
+            matriz = self.sampleGraph(graph,tvals,self.constants,vars,getattr(self,"errors",None))
+        elif matriz is None:
+            matriz = self.sampleScalar(programs,tvals,self.constants,vars,getattr(self,"errors",None))
+        return matriz
+
+    def resample(self, fp, sample, tvals):
+        '''(ts, points) for the Sampling of fp other than Fixed, starting from tvals'''
+        if fp.Sampling == "ArcLength":
+            return self.sampleArcLength(sample,tvals,fp.PointCount,fp.Spacing,fp.MaxPoints)
+        return self.sampleAdaptive(sample,tvals,fp.Tolerance,fp.AngleTolerance,fp.MaxPoints)
+
+    def insertBreakpoints(self, graph, tvals):
+        '''tvals with more values of t added where a piecewise function of t in the formulas (lt,
+        interval, floor, mod, abs, ternary and the others in FormulaGraph.branchOf) switches branch
+        between two of them.  The switch is found by bisecting on the branches taken down to
+        Interval/2^20, as sampleAdaptive does, then the t on both sides of it is added if the curve
+        jumps there, or just one t if it only has a corner.  Switches that happen at a single t,
+        like isequal(), are not found.'''
+        ts = list(tvals)
+        if not graph:
+            FreeCAD.Console.PrintWarning("ParametricCurve: breakpoints not used, a variable is used before it is set\n")
+            return ts
+        try:
+            function = graph.makeFunction(branches=True)
+        except ValueError as e:
+            FreeCAD.Console.PrintWarning(f"ParametricCurve: breakpoints not used, {e}\n")
+            return ts
+        def evaluate(t):
+            try:
+                result = function(t)
+                return result[3],FreeCAD.Vector(*result[:3])
+            except Exception:
+                return None,None #errors are reported when the curve itself is sampled
+        if len(ts) < 2 or evaluate(ts[0])[0] == ():
+            return ts #no piecewise functions of t
+        minStep = abs(ts[1]-ts[0]) / 2**20
+        result = [ts[0]]
+        added = 0
+        previous = evaluate(ts[0])
+        for t0,t1 in zip(ts,ts[1:]):
+            current = evaluate(t1)
+            pending = [(t0,previous,t1,current)]
+            switches = []
+            while pending and added < len(ts):
+                lo,a,hi,b = pending.pop()
+                if a[0] is None or b[0] is None or a[0] == b[0]:
+                    continue
+                left,right = (lo,a),(hi,b)
+                while abs(right[0]-left[0]) > minStep:
+                    t = (left[0]+right[0]) / 2
+                    mid = (t,evaluate(t))
+                    if mid[1][0] is None:
+                        break
+                    if mid[1][0] != left[1][0]:
+                        right = mid
+                    else:
+                        left = mid
+                switches.append((left,right))
+                added += 1
+                pending.extend([(lo,a,)+left,right+(hi,b)]) #there may be more on either side
+            chord = max((current[1]-previous[1]).Length if current[1] and previous[1] else 0.0, 1e-7)
+            for left,right in sorted(switches,key=lambda switch: abs(switch[0][0]-t0)):
+                jump = left[1][1] and right[1][1] and (right[1][1]-left[1][1]).Length > chord*1e-3
+                for t in ([left[0],right[0]] if jump else [(left[0]+right[0])/2]):
+                    if t != result[-1] and t != t1:
+                        result.append(t)
+            result.append(t1)
+            previous = current
+        if added >= len(ts):
+            FreeCAD.Console.PrintWarning("ParametricCurve: too many breakpoints, only the first %d used, try a smaller Interval\n" % added)
+        return result
+
+    def sampleArcLength(self, sample, tvals, count=0, spacing=0.0, maxPoints=0):
+        '''Points equally spaced along the curve.  The points at tvals make a table of the length
+        along the curve at each t (adding up the chords, so tvals should be close enough for the
+        chords to follow the curve), then the t for each wanted length is interpolated from the
+        table and those are sampled, in one call to sample(ts) each.  Makes count points, or if
+        count is 0 a point every spacing plus the end point, or as many points as tvals if both
+        are 0, but no more than maxPoints.  Returns (ts, points).'''
+        ts = list(tvals)
+        points = sample(ts)
+        lengths = [0.0]
+        for a,b in zip(points,points[1:]):
+            lengths.append(lengths[-1] + (b-a).Length)
+        total = lengths[-1]
+        if len(ts) < 2 or not total > 0: #nan if the formulas failed
+            return ts,points
+        if count < 2 and spacing > 0:
+            targets = [ii*spacing for ii in range(int(total/spacing)+1)]
+            if total-targets[-1] > 1e-9*total:
+                targets.append(total)
+        else:
+            count = count if count >= 2 else len(ts)
+            targets = [total*ii/(count-1) for ii in range(count)]
+        maxPoints = max(maxPoints,2) if maxPoints else 0 #always both ends
+        if maxPoints and len(targets) > maxPoints:
+            FreeCAD.Console.PrintWarning(f"ParametricCurve: arc length sampling limited to {maxPoints} points by MaxPoints\n")
+            targets = [total*ii/(maxPoints-1) for ii in range(maxPoints)]
+        arcTs = []
+        i = 0
+        for length in targets: #targets increase, so the table is searched only once
+            while i < len(lengths)-2 and lengths[i+1] < length:
+                i += 1
+            chord = lengths[i+1]-lengths[i]
+            f = min(max((length-lengths[i])/chord,0.0),1.0) if chord else 0.0
+            arcTs.append(ts[i] + (ts[i+1]-ts[i])*f)
+        arcTs[0] = ts[0]
+        if targets[-1] >= total:
+            arcTs[-1] = ts[-1]
+        return arcTs,sample(arcTs)
+
+    def sampleAdaptive(self, sample, tvals, tolerance, angle, maxPoints):
+        '''Start with the points at tvals, then keep halving the t intervals where the curve is further
+        than tolerance from the line between the ends, or where it turns by more than angle degrees,
+        checked at 1/4, 1/2 and 3/4 of each interval.  All the checks for one round are evaluated in
+        a single call to sample(ts).  Intervals that are furthest out are halved first if there are
+        not enough points left under maxPoints.  Returns (ts, points).'''
+        ts = list(tvals)
+        points = sample(ts)
+        if len(ts) < 2:
+            return ts,points
+        if len(ts) >= maxPoints:
+            FreeCAD.Console.PrintWarning(f"ParametricCurve: adaptive sampling added no points, MaxPoints = {maxPoints} is not more than the {len(ts)} points to start with\n")
+        minStep = abs(ts[1]-ts[0]) / 2**20 #do not chase discontinuities forever
+        pending = list(range(len(ts)-1)) #intervals (ts[i], ts[i+1]) still to be checked
+        while pending and len(ts) < maxPoints:
+            checks = [ts[i] + (ts[i+1]-ts[i]) * f for i in pending for f in (0.25,0.5,0.75)]
+            tested = sample(checks)
+            splits = []
+            for n,i in enumerate(pending):
+                if abs(ts[i+1]-ts[i]) < minStep:
+                    continue
+                q1,mid,q3 = tested[3*n:3*n+3]
+                score = 0.0
+                if tolerance > 0:
+                    score = max(self.chordDeviation(points[i],points[i+1],p) for p in (q1,mid,q3)) / tolerance
+                if angle > 0:
+                    score = max(score, self.bendAngle(points[i],mid,points[i+1]) / angle)
+                if score > 1: #nan, e.g. from failed evaluations, is never split
+                    splits.append((score,i,checks[3*n+1],mid))
+            splits.sort(key=lambda split: -split[0])
+            if len(splits) > maxPoints - len(ts):
+                FreeCAD.Console.PrintWarning(f"ParametricCurve: adaptive sampling stopped at MaxPoints = {maxPoints}, curve may not be within tolerance\n")
+                splits = splits[:maxPoints - len(ts)]
+            added = {i:(tm,mid) for score,i,tm,mid in splits}
+            newTs = []
+            newPoints = []
+            pending = []
+            for i in range(len(ts)):
+                newTs.append(ts[i])
+                newPoints.append(points[i])
+                if i in added:
+                    pending.extend([len(newTs)-1,len(newTs)])
+                    newTs.append(added[i][0])
+                    newPoints.append(added[i][1])
+            ts,points = newTs,newPoints
+        return ts,points
+
+    @staticmethod
+    def chordDeviation(a, b, p):
+        '''distance from point p to the line segment from a to b'''
+        ab = b - a
+        ap = p - a
+        length2 = ab.dot(ab)
+        if not length2:
+            return ap.Length
+        u = max(0.0, min(1.0, ap.dot(ab) / length2))
+        return (ap - ab * u).Length
+
+    @staticmethod
+    def bendAngle(a, m, b):
+        '''angle in degrees between the directions a to m and m to b'''
+        v1 = m - a
+        v2 = b - m
+        lengths = v1.Length * v2.Length
+        if not lengths:
+            return 0.0
+        return math.degrees(math.acos(max(-1.0, min(1.0, v1.dot(v2) / lengths))))
+
+    def sampleScalar(self, programs, tvals, constants={}, vars=None, errors=None):
+        '''evaluate the compiled formulas one value of t at a time, returns the list of points.
+        Failures are added to errors, or reported at the end if there is no errors'''
+        ownErrors = errors is None
+        errors = SampleErrors() if ownErrors else errors
+        errors.samples += len(tvals)
+        vars = {} if vars is None else vars
+        if not vars:
+            vars.update({"a":0,"b":0,"c":0,"X":0,"Y":0,"Z":0,"t":0})
+            vars.update(constants)
+        matriz = []
+        for t in tvals:
             try:
                 vars["t"] = t
-                value="a ->"+str(fa)
-                a=evaluate(fa,vars)
-                vars["a"]=a
-                value="b ->"+str(fb)
-                b=evaluate(fb,vars)
-                vars["b"] = b
-                value="c ->"+str(fc)
-                c=evaluate(fc,vars)
-                vars["c"]=c
-                for dd in range(0,len(fp.d)):#fp.d[0] = d1, fp.d[1] = d2, etc
-                    k = "d"+str(dd+1)# where dd = 0, k = "d1"
-                    value = k+" ->"+str(fp.d[dd])
-                    vars[k] = evaluate(self.stripComments(fp.d[dd]),vars)
-                value="X ->"+str(fx)
-                fxx=evaluate(fx,vars)
-                vars["X"]=fxx
-                value="Y ->"+str(fy)
-                fyy=evaluate(fy,vars)
-                vars["Y"]=fyy
-                value="Z ->"+str(fz)
-                fzz=evaluate(fz,vars)
-                vars["Z"]=fzz
-            except ZeroDivisionError:
-                FreeCAD.Console.PrintError("Error division by zero in calculus of "+value+"() for t="+str(t)+" !")
-            except:
-                FreeCAD.Console.PrintError("Error in the formula of "+value+"() !")
-
-            matriz.append(FreeCAD.Vector(fxx,fyy,fzz))
-            t+=intv
-        if not matriz:
-            FreeCAD.Console.PrintWarning("ParametricCurve: --vector list is empty, returning null shape\n")
-            return Part.Shape()
-        if fp.ShapeType == "Polygon" and fp.Closed == True:
-            matriz.append(matriz[0])
-        fp.Points = matriz
-        curva = Part.makePolygon(matriz)
-        if fp.ShapeType == "BSpline":
-            curve = Part.BSplineCurve()
-            curve.interpolate(matriz, PeriodicFlag=fp.Closed)
-            return curve.toShape()
-        elif fp.ShapeType == "Polygon":
-            return curva
-        else: #fp.ShapeType == "Points":
-            vertices = [Part.Vertex(p) for p in fp.Points]
-            comp = Part.Compound(vertices)
-            return comp
+                for k,value,program in programs:
+                    vars[k] = evaluateProgram(program,vars)
+            except Exception as e:
+                errors.add(t,value,e)
+
+            matriz.append(FreeCAD.Vector(vars["X"],vars["Y"],vars["Z"]))
+        if ownErrors:
+            errors.report()
+        return matriz
+
+    def sampleGraph(self, graph, tvals, constants={}, vars=None, errors=None):
+        '''evaluate a FormulaGraph one value of t at a time, returns the list of points.
+        Failures are added to errors, or reported at the end if there is no errors'''
+        ownErrors = errors is None
+        errors = SampleErrors() if ownErrors else errors
+        errors.samples += len(tvals)
+        vars = {} if vars is None else vars
+        if not vars:
+            vars.update({"a":0,"b":0,"c":0,"X":0,"Y":0,"Z":0})
+            vars.update(constants)
+        ops = graph.ops
+        vals = list(graph.values)
+        matriz = []
+        try:
+            run = graph.makeFunction()
+        except ValueError:
+            run = None
+        for t in tvals:
+            if run:
+                try:
+                    vars["X"],vars["Y"],vars["Z"] = run(t)
+                    matriz.append(FreeCAD.Vector(vars["X"],vars["Y"],vars["Z"]))
+                    continue
+                except Exception:
+                    pass #evaluate this t again node by node, which reports the error
+            vals[0] = t
+            try:
+                for k,value,nodes,result in graph.steps:
+                    for i in nodes:
+                        func,vfunc,args,op = ops[i]
+                        vals[i] = func(*[vals[a] for a in args])
+                    vars[k] = vals[result]
+            except Exception as e:
+                errors.add(t,value,e)
+
+            matriz.append(FreeCAD.Vector(vars["X"],vars["Y"],vars["Z"]))
+        if ownErrors:
+            errors.report()
+        return matriz
+
+    def sampleVectorized(self, graph, tvals, constants={}):
+        '''evaluate a FormulaGraph for all values of t at once using numpy arrays.
+        Returns None if that is not possible, in which case sampleGraph() should be used.'''
+        if not np or not tvals:
+            return None
+        n = len(tvals)
+        vals = list(graph.values)
+        vals[0] = np.array(tvals,dtype=float)
+        try:
+            with np.errstate(all="ignore"):
+                for k,value,nodes,result in graph.steps:
+                    for i in nodes:
+                        func,vfunc,args,op = graph.ops[i]
+                        if vfunc:
+                            vals[i] = np.asarray(vfunc(*[vals[a] for a in args]))
+                        else: #no array form for this function, so evaluate this node one t at a time
+                            columns = [np.broadcast_to(vals[a],(n,)).tolist() for a in args]
+                            vals[i] = np.array([func(*xs) for xs in zip(*columns)])
+                        if vals[i].dtype.kind in "biuO": #e.g. lt(), would overflow or divide by zero silently as int64
+                            vals[i] = vals[i].astype(float)
+                        if vals[i].dtype.kind in "fc" and not np.all(np.isfinite(vals[i])):
+                            return None #sampleGraph() will report the error
+        except Exception:
+            return None
+        xyz = [np.broadcast_to(vals[graph.results[k]] if k in graph.results else constants[k],(n,)).tolist() for k in ("X","Y","Z")]
+        return [FreeCAD.Vector(x,y,z) for x,y,z in zip(*xyz)]
 
     def execute(self, fp):
         '''Do something when doing a recomputation, this method is mandatory'''
         if self.bInhibitRecompute: #some things do not require a recompute, such as saving to JSON file or updating spreadsheet
             self.bInhibitRecompute = False
             return
-
-        fp.Shape = self.makeCurve(fp)
+        if hasattr(fp,"Profile") and fp.Profile:
+            fp.Profile = False
+            self.profileRecompute(fp)
+        else:
+            self.recompute(fp)
+
+    def recompute(self, fp, background=True):
+        '''make the curve, unless nothing it is made from has changed'''
+        #fc(expr) values are found once here, then makeCurve() uses them for all the formulas.  If the
+        #hash of everything the curve is made from is unchanged, for example when a full recompute
+        #of the document touches every curve, the previous shape and points are kept
+        self.timer = StageTimer() if hasattr(fp,"Timing") and fp.Timing else None
+        inputs = self.effectiveInputs(fp)
+        fcValues = self.resolveFCReferences(inputs["formulas"],fp if hasattr(fp,"evalExpression") else None)
+        inputsHash = self.hashInputs(inputs,fcValues)
+        if self.timer:
+            self.timer.lap("inputs")
+        if fcValues is not None and inputsHash == getattr(self,"inputsHash",None):
+            self.cancelBackground() #e.g. an edit was undone while sampling in the background
+            self.reportTiming(fp,"unchanged, previous shape kept")
+            return
+        if background and fcValues is not None and self.backgroundEnabled(fp):
+            job = getattr(self,"job",None)
+            if not job or job.inputsHash != inputsHash:
+                self.startBackground(fp,fcValues,inputsHash)
+            self.reportTiming(fp,"sampling in the background")
+            return
+        self.cancelBackground()
+        shape = self.makeCurve(fp,fcValues)
+        self.inputsHash = inputsHash if fcValues is not None and not shape.isNull() else None #errors are shown again next time
+        self.setShape(fp,shape)
+        self.reportTiming(fp)
+
+    def setShape(self, fp, shape):
+        '''set the Shape, making a face if MakeFace, and the properties that depend on it'''
+        self.pointsDrawn = self.pointsOnly(fp) and not shape.isNull() #for CurveVP, set before the Shape changes
+        ConsumerObserver.update(fp,self.pointsDrawn)
+        fp.Shape = shape
         if hasattr(fp.Shape,"Continuity"):
             fp.Continuity = fp.Shape.Continuity
         else:
             fp.Continuity = "N/A"
-        if fp.MakeFace and fp.Shape.isClosed():
+        if fp.MakeFace and not self.pointsDrawn and fp.Shape.isClosed():
             try:
                 face = Part.makeFace(fp.Shape,"Part::FaceMakerCheese")
                 fp.Shape = face
             except:
                 pass
+            if getattr(self,"timer",None):
+                self.timer.lap("makeFace")
         #FreeCAD.Console.PrintMessage("Recompute Python Curve feature"+chr(10))
         self.updateFloats(fp)
 
-    def updateFloat(self, fp, propstr, propfloat):
+    def backgroundEnabled(self, fp):
+        return hasattr(fp,"Background") and fp.Background and getattr(FreeCAD,"GuiUp",False)
+
+    def startBackground(self, fp, fcValues, inputsHash):
+        '''sample the curve in a worker thread, the current shape stays until finishBackground() swaps
+        in the new one.  The worker gets a copy of the properties it needs, not fp itself.'''
+        self.cancelBackground()
+        self.updateFromSpreadsheet(fp)
+        snapshot = types.SimpleNamespace(a=fp.a,b=fp.b,c=fp.c,d=list(fp.d),X=fp.X,Y=fp.Y,Z=fp.Z,
+                t_min=fp.t if hasattr(fp,"t") else fp.t_min,t_max=fp.t_max,Interval=fp.Interval)
+        for prop in ["PlusOneIteration","Vectorize","Sampling","Tolerance","AngleTolerance","MaxPoints","PointCount","Spacing","MaxErrors","Breakpoints",
+                     "SampleDistribution","TList"]:
+            if hasattr(fp,prop):
+                setattr(snapshot,prop,getattr(fp,prop))
+        self.job = BackgroundJob(snapshot,fcValues,inputsHash)
+        self.job.start()
+        if not getattr(self,"pollTimer",None):
+            self.pollTimer = QtCore.QTimer()
+            self.pollTimer.timeout.connect(lambda: self.finishBackground(fp))
+        self.pollTimer.start(50)
+
+    def backgroundPoints(self, snapshot, fcValues, cancel):
+        '''runs in the worker thread, returns (ts, graph, points) for the snapshot of the properties,
+        raises Cancelled as soon as cancel is set'''
+        compiled = self.compileFormulas(snapshot,fcValues)
+        tRange = self.tRange(snapshot)
+        if not compiled or not tRange:
+            return [],None,[]
+        graph,programs = compiled
+        if getattr(snapshot,"Sampling","Fixed") != "Fixed" or getattr(snapshot,"Breakpoints",False):
+            def sample(ts):
+                if cancel.is_set():
+                    raise Cancelled()
+                return self.sample(snapshot,graph,programs,ts)
+            self.errors = SampleErrors(getattr(snapshot,"MaxErrors",0))
+            try:
+                ts = list(self.tValues(*tRange))
+                if getattr(snapshot,"Breakpoints",False):
+                    ts = self.insertBreakpoints(graph,ts)
+                if getattr(snapshot,"Sampling","Fixed") == "Fixed":
+                    return ts,graph,sample(ts)
+                ts,points = self.resample(snapshot,sample,ts)
+                return ts,graph,points
+            finally:
+                self.errors.report()
+                self.errors = None
+        matriz = []
+        for chunk in self.iterPoints(snapshot,10000,fcValues,cancel):
+            matriz.extend(chunk)
+        return list(self.tValues(*tRange)),graph,matriz
+
+    def finishBackground(self, fp):
+        '''called by pollTimer in the main thread, swaps in the new shape when the worker is done'''
+        job = getattr(self,"job",None)
+        if job and job.is_alive():
+            return
+        self.pollTimer.stop()
+        self.job = None
+        if not job or job.cancel.is_set() or (job.points is None and not job.aborted):
+            return
+        try:
+            self.constants = job.constants
+            shape = Part.Shape() if job.aborted else self.makeShape(fp,job.points,job.ts,job.graph)
+            self.inputsHash = job.inputsHash if not shape.isNull() else None
+            self.setShape(fp,shape)
+            fp.Document.recompute() #objects using the curve, this one is up to date so it is skipped
+        except Exception as e: #e.g. the object was deleted meanwhile
+            FreeCAD.Console.PrintLog(f"ParametricCurve: background result discarded: {e}\n")
+
+    def cancelBackground(self):
+        '''stop the worker, if any, its result will not be used'''
+        job = getattr(self,"job",None)
+        if job:
+            job.cancel.set()
+            self.job = None
+
+    def profileRecompute(self, fp):
+        '''run recompute() with cProfile and tracemalloc, then write the profile to a .prof file and the
+        top allocation sites to a text file, both next to the document, or in the temp folder if the
+        document has not been saved'''
+        fileName = fp.Document.FileName if hasattr(fp,"Document") else ""
+        folder = os.path.dirname(fileName) if fileName else tempfile.gettempdir()
+        docName = os.path.splitext(os.path.basename(fileName))[0] if fileName else "Unnamed"
+        base = os.path.join(folder,f"{docName}_{fp.Name}")
+        tracing = tracemalloc.is_tracing()
+        if not tracing:
+            tracemalloc.start(10)
+        if hasattr(tracemalloc,"reset_peak"): #python 3.9+
+            tracemalloc.reset_peak()
+        before = tracemalloc.take_snapshot()
+        profiler = cProfile.Profile()
+        try:
+            profiler.runcall(self.recompute,fp,False)
+        finally:
+            after = tracemalloc.take_snapshot()
+            current,peak = tracemalloc.get_traced_memory()
+            if not tracing:
+                tracemalloc.stop()
+            ignore = [tracemalloc.Filter(False,tracemalloc.__file__),tracemalloc.Filter(False,cProfile.__file__)]
+            allocations = after.filter_traces(ignore).compare_to(before.filter_traces(ignore),"lineno")
+            try:
+                profiler.dump_stats(base+".prof")
+                with open(base+"_allocations.txt","w") as f:
+                    f.write(f"ParametricCurve {fp.Name} version {__version__}, peak traced memory {peak/1024:.1f} KiB\n")
+                    f.write("Top allocation sites during the recompute (size, change since start, count):\n")
+                    for stat in allocations[:25]:
+                        f.write(str(stat)+"\n")
+                FreeCAD.Console.PrintMessage(f"ParametricCurve: profile written to {base}.prof and {base}_allocations.txt\n")
+            except OSError as e:
+                FreeCAD.Console.PrintError(f"ParametricCurve: unable to write profile: {e}\n")
+
+    def reportTiming(self, fp, note=""):
+        '''show the stage times of this recompute in TimingReport and the report view'''
+        if not self.timer:
+            return
+        lines = ([note] if note else []) + self.timer.report()
+        self.timer = None
+        fp.TimingReport = lines
+        FreeCAD.Console.PrintMessage(f"ParametricCurve timing ({fp.Label}): {', '.join(lines)}\n")
+
+    def effectiveInputs(self, fp):
+        '''dictionary of the values makeCurve() will use, taken from the spreadsheet if UseSpreadsheet
+        is True, without setting any properties'''
+        sheet = fp.Spreadsheet if fp.Spreadsheet and hasattr(fp.Spreadsheet,"a_cell") and fp.UseSpreadsheet else None
+        if sheet:
+            d = []
+            while hasattr(sheet,"d"+str(len(d)+1)):
+                d.append(str(getattr(sheet,"d"+str(len(d)+1))))
+            formulas = [str(sheet.a_cell),str(sheet.b_cell),str(sheet.c_cell),str(sheet.X),str(sheet.Y),str(sheet.Z)] + d
+            tparams = [sheet.t_min,sheet.t_max,sheet.interval]
+        else:
+            formulas = [fp.a,fp.b,fp.c,fp.X,fp.Y,fp.Z] + list(fp.d)
+            tparams = [fp.t if hasattr(fp,"t") else fp.t_min,fp.t_max,fp.Interval]
+        inputs = {"formulas":[self.stripComments(formula) for formula in formulas], "t":tparams}
+        for prop in ["ShapeType","Closed","MakeFace","PlusOneIteration","Vectorize","Sampling","Tolerance","AngleTolerance","MaxPoints","PointCount","Spacing","MaxErrors","Breakpoints",
+                     "SampleDistribution","TList","Parameterization","Tangents","Approximate","ApproxTolerance","MaxDegree"]:
+            inputs[prop] = getattr(fp,prop,None)
+        inputs["pointsOnly"] = self.pointsOnly(fp) #so the vertices are made once another object links to this one
+        return inputs
+
+    def hashInputs(self, inputs, fcValues):
+        '''content hash of the inputs from effectiveInputs() and the fc(expr) values'''
+        data = json.dumps([inputs,fcValues,__version__],sort_keys=True,default=str)
+        return hashlib.sha1(data.encode("utf-8")).hexdigest()
+
+    def resolveFCReferences(self, formulas, obj=None):
+        '''evaluate each fc(expr) in the formulas, returns dictionary of expr:value, or None on error'''
+        fcValues = {}
         try:
-            fval = evaluate(self.stripComments(getattr(fp,propstr)))
-            setattr(fp,propfloat,fval)
+            for formula in formulas:
+                checkForFCEval(formula,obj,fcValues)
         except Exception:
-            setattr(fp,propfloat,0.0)
+            return None #makeCurve() will report the error
+        return fcValues
+
+    def constantValue(self, propstr):
+        '''value of variable propstr as found by makeCurve() if it does not depend on t, else 0.0'''
+        try:
+            return float(getattr(self,"constants",{}).get(propstr,0.0))
+        except Exception:
+            return 0.0
+
+    def updateFloat(self, fp, propstr, propfloat):
+        setattr(fp,propfloat,self.constantValue(propstr))
 
     def updateFloats(self, fp):
         if not hasattr(fp, "F_a"): #do not break existing objects created with earlier versions
@@ -893,10 +2368,7 @@ Use Open File to open file in external editor.\n\
             self.updateFloat(fp,propstr,f"F_{propstr}")
         d_vals = [0.0] #dummy first value so we can 1-index into the array
         for dd,val in enumerate(fp.d):
-            try:
-                d_vals.append(evaluate(self.stripComments(val)))
-            except:
-                d_vals.append(0.0)
+            d_vals.append(self.constantValue("d"+str(dd+1)))
         d_vals = d_vals if not d_vals == [0.0] else []
         setattr(fp, "F_d",d_vals)
 
@@ -968,6 +2440,14 @@ class TaskEditFormulasPanel: #formula editor
         self.checkBoxSorted.setChecked(self.sorted)
         topButtonBox.addWidget(self.checkBoxSorted)
 
+        self.checkBoxPreview = QtGui.QCheckBox("Preview")
+        self.checkBoxPreview.setLayoutDirection(QtCore.Qt.LeftToRight)
+        self.checkBoxPreview.setToolTip ("Show a quick, low resolution preview of the current formula in the 3D view while editing\n\
+The object itself is not changed until OK or Apply\n")
+        self.checkBoxPreview.setChecked(True)
+        self.checkBoxPreview.clicked.connect(self.schedulePreview)
+        topButtonBox.addWidget(self.checkBoxPreview)
+
         buttonPlus = QtGui.QPushButton("+")
         buttonPlus.setToolTip ("Add new formula, a copy of selected formula")
         topButtonBox.addWidget(buttonPlus)
@@ -1084,6 +2564,7 @@ Overwrites any existing content in the file\n")
         self.json = self.shallowCopy(self.fp.Proxy.JSON_Data)
         self.updateFormulaList()
         self.populateLines(self.formulaList.itemAt(0,0).text())
+        self.setupPreview()
 
     def shallowCopy(self,fromdict):
         """make shallow copy of dictionary of dictionaries"""
@@ -1427,7 +2908,103 @@ Overwrites any existing content in the file\n")
         self.t_max_Line.setText(cur["t_max"])
         self.blockSignals = False
 
+#live preview: editing any of the lines restarts previewTimer, when it fires the current formula
+#is sampled as finely as fits in previewBudget and drawn as a coin line set on top of the
+#3D view.  Nothing in the document is changed, the preview is removed on OK or Cancel
+    previewBudget = 0.03 #seconds
+    previewDelay = 250 #milliseconds after the last edit
+
+    def setupPreview(self):
+        self.preview = None #coin separator in the scene graph while a preview is shown
+        self.previewTimer = QtCore.QTimer()
+        self.previewTimer.setSingleShot(True)
+        self.previewTimer.timeout.connect(self.updatePreview)
+        for line in [self.a_Line,self.b_Line,self.c_Line,self.X_Line,self.Y_Line,self.Z_Line,
+                     self.t_min_Line,self.interval_Line,self.t_max_Line,self.d_Lines]:
+            line.textChanged.connect(self.schedulePreview)
+        self.schedulePreview()
+
+    def schedulePreview(self, *args):
+        self.previewTimer.start(self.previewDelay)
+
+    def previewPoints(self):
+        '''points of the formula in the line edits, as many as fit in previewBudget but no more than
+        the interval gives, or None if the formula is incomplete'''
+        start = time.perf_counter()
+        curve = Curve.__new__(Curve) #scratch proxy, so the object's own proxy is not changed
+        strip = curve.stripComments
+        try:
+            snapshot = types.SimpleNamespace(a=self.a_Line.text(),b=self.b_Line.text(),c=self.c_Line.text(),
+                    d=self.d_Lines.toPlainText().split("\n"),X=self.X_Line.text(),Y=self.Y_Line.text(),Z=self.Z_Line.text(),
+                    t_min=evaluate(strip(self.t_min_Line.text())),t_max=evaluate(strip(self.t_max_Line.text())),
+                    Interval=evaluate(strip(self.interval_Line.text())),Vectorize=getattr(self.fp,"Vectorize",True),
+                    evalExpression=self.fp.evalExpression) #fc(expr) is evaluated by the object, read only
+        except Exception:
+            return None
+        if not snapshot.Interval or snapshot.t_max == snapshot.t_min:
+            return None
+        formulas = [strip(formula) for formula in [snapshot.a,snapshot.b,snapshot.c,snapshot.X,snapshot.Y,snapshot.Z] + snapshot.d]
+        fcValues = curve.resolveFCReferences(formulas,self.fp)
+        compiled = curve.compileFormulas(snapshot,fcValues,quiet=True) if fcValues is not None else None
+        if not compiled:
+            return None
+        graph,programs = compiled
+        curve.errors = SampleErrors() #failed samples are not reported while typing
+        t,tf = snapshot.t_min,snapshot.t_max
+        count = max(2,min(int(abs((tf-t)/snapshot.Interval))+1,100000)) #at least both ends, e.g. while typing the interval
+        tvals = lambda n: [t+(tf-t)*ii/(n-1) for ii in range(n)]
+        #start with a few samples, then resample with as many as the rate so far says will fit in
+        #the rest of the budget, until that is not at least twice as many
+        n = min(count,16)
+        while True:
+            sampleStart = time.perf_counter()
+            points = curve.sample(snapshot,graph,programs,tvals(n))
+            now = time.perf_counter()
+            more = min(count,int(0.8*(self.previewBudget-(now-start))/((now-sampleStart)/n))) #some margin for the drawing
+            if more < 2*n:
+                return points
+            n = more
+
+    def updatePreview(self):
+        if not self.checkBoxPreview.isChecked():
+            self.removePreview()
+            return
+        points = self.previewPoints()
+        if points is None: #keep the last preview while the formula is being typed
+            return
+        if not self.preview:
+            view = FreeCADGui.ActiveDocument.ActiveView if FreeCADGui.ActiveDocument else None
+            if not hasattr(view,"getSceneGraph"): #e.g. a spreadsheet or TechDraw page is the active view
+                return
+            self.preview = coin.SoSeparator()
+            self.previewTransform = coin.SoTransform()
+            color = coin.SoBaseColor()
+            color.rgb = (1.0,0.5,0.0)
+            style = coin.SoDrawStyle()
+            style.lineWidth = 2
+            style.linePattern = 0xf0f0 #dashed, so it is not mistaken for the curve
+            self.previewCoords = coin.SoCoordinate3()
+            self.previewLines = coin.SoLineSet()
+            for node in [self.previewTransform,color,style,self.previewCoords,self.previewLines]:
+                self.preview.addChild(node)
+            self.previewRoot = view.getSceneGraph()
+            self.previewRoot.addChild(self.preview)
+        placement = self.fp.getGlobalPlacement() if hasattr(self.fp,"getGlobalPlacement") else self.fp.Placement
+        self.previewTransform.translation.setValue(tuple(placement.Base))
+        self.previewTransform.rotation.setValue(placement.Rotation.Q)
+        self.previewCoords.point.setValues(0,len(points),[tuple(point) for point in points])
+        self.previewCoords.point.setNum(len(points))
+        self.previewLines.numVertices.setValue(len(points))
+
+    def removePreview(self):
+        if hasattr(self,"previewTimer"):
+            self.previewTimer.stop()
+        if getattr(self,"preview",None):
+            self.previewRoot.removeChild(self.preview)
+            self.preview = None
+
     def reject(self):
+        self.removePreview()
         if not FreeCAD.ActiveDocument:
             FreeCADGui.Control.closeDialog()
             return
@@ -1437,6 +3014,7 @@ Overwrites any existing content in the file\n")
         FreeCAD.ActiveDocument.recompute()
 
     def accept(self):
+        self.removePreview()
         if not FreeCAD.ActiveDocument:
             FreeCADGui.Control.closeDialog()
             return
@@ -1539,11 +3117,37 @@ class CurveVP:
     def attach(self, obj):
         '''Setup the scene sub-graph of the view provider, this method is mandatory'''
         self.Object = obj.Object
+        #with the Points shape type and LightweightPoints, fp.Points are drawn here as a point set
+        #instead of by the Part view provider from a vertex per point
+        self.pointsSwitch = coin.SoSwitch()
+        separator = coin.SoSeparator()
+        self.pointsColor = coin.SoBaseColor()
+        self.pointsStyle = coin.SoDrawStyle()
+        self.pointsCoords = coin.SoCoordinate3()
+        for node in [self.pointsColor,self.pointsStyle,self.pointsCoords,coin.SoPointSet()]:
+            separator.addChild(node)
+        self.pointsSwitch.addChild(separator)
+        obj.RootNode.addChild(self.pointsSwitch)
+        self.updatePoints(obj)
+
+    def updatePoints(self, vobj):
+        '''show fp.Points in pointsSwitch if the Part view provider is not drawing them'''
+        fp = vobj.Object
+        show = getattr(getattr(fp,"Proxy",None),"pointsDrawn",False) and fp.ShapeType == "Points" and vobj.Visibility
+        if show:
+            self.pointsColor.rgb = tuple(vobj.PointColor[:3])
+            self.pointsStyle.pointSize = vobj.PointSize
+            self.pointsCoords.point.setValues(0,len(fp.Points),[tuple(point) for point in fp.Points])
+            self.pointsCoords.point.setNum(len(fp.Points))
+        else:
+            self.pointsCoords.point.setNum(0)
+        self.pointsSwitch.whichChild = coin.SO_SWITCH_ALL if show else coin.SO_SWITCH_NONE
 
     def updateData(self, fp, prop):
         '''If a property of the handled feature has changed we have the chance to handle this here'''
         # fp is the handled feature, prop is the name of the property that has changed
-        pass
+        if prop in ["Shape","ShapeType"] and hasattr(self,"pointsSwitch"):
+            self.updatePoints(fp.ViewObject)
 
     def canDropObject(self, incoming):
         return incoming.isDerivedFrom("App::TextDocument")
@@ -1576,6 +3180,8 @@ class CurveVP:
     def onChanged(self, vp, prop):
         '''Here we can do something when a single property got changed'''
         #FreeCAD.Console.PrintMessage("Change property: " + str(prop) + ""+chr(10))
+        if prop in ["Visibility","PointColor","PointSize"] and hasattr(self,"pointsSwitch"):
+            self.updatePoints(vp)
 
     def setupContextMenu(self, vobj, menu):
         if vobj.Object.Proxy.editingMode == False:
@@ -0,0 +1,220 @@
+# -*- coding: utf-8 -*-
+__title__ = "Parametric_Curve_FP_benchmark"
+__license__ = "LGPL 2.1"
+__doc__ = "Benchmarks for the Parametric_Curve_FP formula evaluator"
+__usage__ = '''python Parametric_Curve_FP_benchmark.py [--densities 1,4,16] [--repeat 3] [--output results.json]
+from FreeCAD's python or any python 3 with Parametric_Curve_FP.py in the same folder.  When FreeCAD
+is not available some thin stand-ins are used instead so the formulas can be timed without the gui.
+Prints the results as JSON, or with --table the time per sample for each evaluator.'''
+
+import argparse
+import ast
+import json
+import math
+import os
+import platform
+import sys
+import time
+import types
+
+here = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, here)
+
+def installStandIns():
+    '''only the bits of FreeCAD, Part, pivy and PySide the formula code touches, returns True if used'''
+    try:
+        import FreeCAD
+        import Part
+        return False
+    except ImportError:
+        pass
+    class Vector:
+        def __init__(self, x=0.0, y=0.0, z=0.0):
+            self.x, self.y, self.z = float(x), float(y), float(z)
+        def __sub__(self, o):
+            return Vector(self.x-o.x, self.y-o.y, self.z-o.z)
+        def __iter__(self):
+            return iter((self.x, self.y, self.z))
+        @property
+        def Length(self):
+            return math.sqrt(self.x**2+self.y**2+self.z**2)
+    class Console:
+        def PrintMessage(self, s):
+            sys.stdout.write(s)
+        PrintWarning = PrintError = PrintMessage
+        def PrintLog(self, s):
+            pass
+    class Shape:
+        def __init__(self, *args):
+            self.args = args
+        def isNull(self):
+            return not self.args
+    class BSplineCurve:
+        def interpolate(self, pts, PeriodicFlag=False, **kwargs):
+            self.pts = list(pts)
+        def toShape(self):
+            return Shape(self)
+    freecad = types.ModuleType("FreeCAD")
+    freecad.Vector = Vector
+    freecad.Console = Console()
+    freecad.ActiveDocument = None
+    class ProgressIndicator:
+        def start(self, message, steps):
+            pass
+        def next(self, canAbort=False):
+            pass
+        def stop(self):
+            pass
+    freecad.Base = types.SimpleNamespace(Vector=Vector, ProgressIndicator=ProgressIndicator)
+    part = types.ModuleType("Part")
+    part.Shape = Shape
+    part.BSplineCurve = BSplineCurve
+    part.Vertex = part.Compound = Shape
+    part.makePolygon = lambda pts: Shape(list(pts))
+    part.makeFace = lambda *args: Shape(args)
+    coin = types.ModuleType("pivy.coin")
+    pivy = types.ModuleType("pivy")
+    pivy.coin = coin
+    qtgui = types.ModuleType("PySide.QtGui")
+    qtgui.QDialog = qtgui.QWidget = object
+    qtcore = types.ModuleType("PySide.QtCore")
+    pyside = types.ModuleType("PySide")
+    pyside.QtGui, pyside.QtCore = qtgui, qtcore
+    sys.modules.update({"FreeCAD":freecad, "FreeCADGui":types.ModuleType("FreeCADGui"), "Part":part,
+                        "pivy":pivy, "pivy.coin":coin, "PySide":pyside, "PySide.QtGui":qtgui,
+                        "PySide.QtCore":qtcore})
+    return True
+
+standInsUsed = installStandIns()
+import Parametric_Curve_FP as PC
+
+def formulaLibrary():
+    '''the json formula library embedded in Parametric_Curve_FP.makeCurve()'''
+    with open(PC.__file__, encoding="utf-8") as f:
+        tree = ast.parse(f.read())
+    for node in ast.walk(tree):
+        if isinstance(node, ast.FunctionDef) and node.name == "makeCurve" and not node.args.args[1:]:
+            for sub in ast.walk(node):
+                if isinstance(sub, ast.Assign) and getattr(sub.targets[0], "id", "") == "txt":
+                    return json.loads(sub.value.value)
+    raise ValueError("formula library not found")
+
+class FeatureStandIn:
+    '''just the properties of a ParametricCurve object that makeCurve() reads and writes'''
+    def __init__(self, formula, density=1):
+        self.Label = "ParametricCurve"
+        self.a, self.b, self.c, self.d = formula["a"], formula["b"], formula["c"], list(formula["d"])
+        self.X, self.Y, self.Z = formula["X"], formula["Y"], formula["Z"]
+        self.t_min = PC.evaluate(stripComments(formula["t_min"]))
+        self.t_max = PC.evaluate(stripComments(formula["t_max"]))
+        self.Interval = PC.evaluate(stripComments(formula["interval"])) / density
+        self.Closed = False
+        self.PlusOneIteration = True
+        self.Vectorize = True
+        self.Sampling = "Fixed"
+        self.ShapeType = "BSpline"
+        self.Points = []
+        self.Spreadsheet = None
+        self.UseSpreadsheet = False
+        self.MakeFace = False
+
+    def setEditorMode(self, prop, mode):
+        pass
+
+def stripComments(string):
+    return PC.Curve.stripComments(None, string)
+
+def prepare(formula, density=1):
+    '''(curve proxy, feature stand-in, programs, constants, graph, t values) for one library entry,
+    with the library interval divided by density'''
+    curve = PC.Curve.__new__(PC.Curve)
+    fp = FeatureStandIn(formula, density)
+    formulas = [("a", stripComments(fp.a)), ("b", stripComments(fp.b)), ("c", stripComments(fp.c))]
+    for ii,d in enumerate(fp.d):
+        formulas.append(("d"+str(ii+1), stripComments(d)))
+    formulas.extend([("X", stripComments(fp.X)), ("Y", stripComments(fp.Y)), ("Z", stripComments(fp.Z))])
+    programs = [(k, value, PC.compileFormula(value)) for k,value in formulas]
+    constants, programs = curve.hoistConstants(programs)
+    graph = PC.FormulaGraph(programs, constants)
+    tvals = list(curve.tValues(*curve.tRange(fp))) #the same values of t as makeCurve()
+    return curve, fp, programs, constants, graph, tvals
+
+def sampleStack(programs, tvals, constants):
+    '''the loop of Curve.sampleScalar() with the old recursive evaluate_stack() instead of evaluateProgram()'''
+    vars = {"a":0, "b":0, "c":0, "X":0, "Y":0, "Z":0, "t":0}
+    vars.update(constants)
+    matriz = []
+    for t in tvals:
+        vars["t"] = t
+        for k,value,program in programs:
+            vars[k] = PC.evaluate_stack(program[:], vars)
+        matriz.append(PC.FreeCAD.Vector(vars["X"], vars["Y"], vars["Z"]))
+    return matriz
+
+def best(func, repeat=5):
+    times = []
+    for ii in range(repeat):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+def perSample():
+    '''microseconds per value of t: evaluate_stack, evaluateProgram (sampleScalar()), generated code
+    (sampleGraph()), and the generated function alone without making the points'''
+    print("%-20s %8s %14s %15s %14s %14s" % ("formula", "samples", "evaluate_stack", "evaluateProgram", "sampleGraph", "function"))
+    for name,formula in formulaLibrary().items():
+        curve, fp, programs, constants, graph, tvals = prepare(formula)
+        run = graph.makeFunction()
+        n = len(tvals)
+        stack = best(lambda: sampleStack(programs, tvals, constants)) / n * 1e6
+        scalar = best(lambda: curve.sampleScalar(programs, tvals, constants)) / n * 1e6
+        generated = best(lambda: curve.sampleGraph(graph, tvals, constants)) / n * 1e6
+        function = best(lambda: [run(t) for t in tvals]) / n * 1e6
+        print("%-20s %8d %12.2fus %13.2fus %12.2fus %12.2fus" % (name, n, stack, scalar, generated, function))
+
+def suite(densities=(1, 4, 16), repeat=3):
+    '''Time each library formula: parsing all its formulas, evaluation per value of t with each
+    evaluator, and the whole of makeCurve(), at the library interval divided by each density.
+    Returns a dictionary that can be saved as JSON and compared with other versions.'''
+    results = {}
+    for name,formula in formulaLibrary().items():
+        curve, fp, programs, constants, graph, tvals = prepare(formula)
+        sources = [stripComments(source) for source in [fp.a, fp.b, fp.c, fp.X, fp.Y, fp.Z] + fp.d]
+        entry = {"parse_us": best(lambda: [PC.compileFormula(source) for source in sources], repeat) * 1e6,
+                 "graph": graph.report(), "densities": []}
+        for density in densities:
+            curve, fp, programs, constants, graph, tvals = prepare(formula, density)
+            n = len(tvals)
+            fp.Vectorize = False
+            timing = {"density": density, "interval": fp.Interval, "samples": n,
+                      "evaluate_stack_us": best(lambda: sampleStack(programs, tvals, constants), repeat) / n * 1e6,
+                      "evaluateProgram_us": best(lambda: curve.sampleScalar(programs, tvals, constants), repeat) / n * 1e6,
+                      "generated_us": best(lambda: curve.sampleGraph(graph, tvals, constants), repeat) / n * 1e6,
+                      "makeCurve_ms": best(lambda: curve.makeCurve(fp), repeat) * 1e3}
+            if PC.np is not None:
+                fp.Vectorize = True
+                timing["vectorized_us"] = best(lambda: curve.sampleVectorized(graph, tvals, constants), repeat) / n * 1e6
+                timing["makeCurve_vectorized_ms"] = best(lambda: curve.makeCurve(fp), repeat) * 1e3
+            timing["points"] = len(fp.Points)
+            entry["densities"].append(timing)
+        results[name] = entry
+    return {"version": PC.__version__, "python": platform.python_version(), "numpy": PC.np.__version__ if PC.np else None,
+            "freecad": not standInsUsed, "repeat": repeat, "formulas": results}
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--table", action="store_true", help="print time per sample for each evaluator instead of the JSON suite")
+    parser.add_argument("--densities", default="1,4,16", help="comma separated divisors of the library interval (default 1,4,16)")
+    parser.add_argument("--repeat", type=int, default=3, help="best of this many runs (default 3)")
+    parser.add_argument("--output", help="write the JSON results to this file instead of printing them")
+    args = parser.parse_args()
+    if args.table:
+        perSample()
+    else:
+        results = json.dumps(suite([float(density) for density in args.densities.split(",")], args.repeat), indent=2)
+        if args.output:
+            with open(args.output, "w") as f:
+                f.write(results)
+        else:
+            print(results)
@@ -0,0 +1,288 @@
+# -*- coding: utf-8 -*-
+__title__ = "Parametric_Curve_FP_test"
+__license__ = "LGPL 2.1"
+__doc__ = "Tests for the Parametric_Curve_FP formula parser and evaluators"
+__usage__ = '''python -m unittest Parametric_Curve_FP_test
+from FreeCAD's python or any python 3 with Parametric_Curve_FP.py in the same folder.  Like the
+benchmark, uses thin stand-ins for FreeCAD when it is not available.'''
+
+import concurrent.futures
+import math
+import random
+import sys
+import unittest
+import warnings
+
+import Parametric_Curve_FP_benchmark as benchmark #installs the stand-ins if FreeCAD is not available
+PC = benchmark.PC
+try:
+    import pyparsing
+except ImportError:
+    pyparsing = None
+
+def pyparsingBNF(exprStack):
+    '''the pyparsing grammar FormulaParser replaced, from fourFn.py by Paul McGuire as it was in
+    Parametric_Curve_FP.py before 2026.10.18, pushing the rpn stack onto exprStack'''
+    def push_first(toks):
+        exprStack.append(toks[0])
+    def push_unary_minus(toks):
+        for t in toks:
+            if t == "-":
+                exprStack.append("unary -")
+            else:
+                break
+    e = pyparsing.CaselessKeyword("E")
+    pi = pyparsing.CaselessKeyword("PI")
+    fnumber = pyparsing.Regex(r'[-+]?(?:(?:\d*\.\d+)|(?:\d+\.?))(?:[Ee][+-]?\d+)?')
+    ident = pyparsing.Word(pyparsing.alphas, pyparsing.alphanums + "_$")
+    plus, minus, mult, div = map(pyparsing.Literal, "+-*/")
+    lpar, rpar = map(pyparsing.Suppress, "()")
+    addop = plus | minus
+    multop = mult | div
+    expop = pyparsing.Literal("^")
+    expr = pyparsing.Forward()
+    expr_list = pyparsing.delimitedList(pyparsing.Group(expr))
+    def insert_fn_argcount_tuple(t):
+        fn = t.pop(0)
+        num_args = len(t[0])
+        t.insert(0, (fn, num_args))
+    fn_call = (ident + lpar - pyparsing.Group(expr_list) + rpar).setParseAction(insert_fn_argcount_tuple)
+    atom = (addop[...] + ((fn_call | pi | e | fnumber | ident).setParseAction(push_first)
+                          | pyparsing.Group(lpar + expr + rpar))).setParseAction(push_unary_minus)
+    factor = pyparsing.Forward()
+    factor <<= atom + (expop + factor).setParseAction(push_first)[...]
+    term = factor + (multop + factor).setParseAction(push_first)[...]
+    expr <<= term + (addop + term).setParseAction(push_first)[...]
+    return expr
+
+def outcome(func, *args):
+    '''func(*args), or the type of exception it raised, as a string so nan compares equal'''
+    try:
+        return repr(func(*args))
+    except Exception as e:
+        return type(e).__name__
+
+def evaluateFormula(formula, samples=200):
+    '''X, Y, Z for the first samples values of t of a library formula, once through compileFormula()
+    and evaluateProgram() and once through FormulaGraph.makeFunction(), each parsed from scratch'''
+    curve, fp, programs, constants, graph, tvals = benchmark.prepare(formula)
+    tvals = tvals[:samples]
+    vars = {"a":0, "b":0, "c":0, "X":0, "Y":0, "Z":0, "t":0}
+    vars.update(constants)
+    def step(t):
+        vars["t"] = t
+        for k,value,program in programs:
+            vars[k] = PC.evaluateProgram(program, vars)
+        return vars["X"], vars["Y"], vars["Z"]
+    scalar = [outcome(step, t) for t in tvals]
+    function = graph.makeFunction()
+    generated = [outcome(lambda t: function(t)[:3], t) for t in tvals]
+    return scalar, generated
+
+class ThreadTest(unittest.TestCase):
+    threads = 16
+    repeats = 8
+
+    def setUp(self):
+        self.switchInterval = sys.getswitchinterval()
+        sys.setswitchinterval(1e-6) #switch threads often, even in the middle of parsing a formula
+
+    def tearDown(self):
+        sys.setswitchinterval(self.switchInterval)
+
+    def testConcurrentFormulas(self):
+        '''many threads parsing and evaluating different formulas at once give the serial results'''
+        library = benchmark.formulaLibrary()
+        serial = {name:evaluateFormula(formula) for name,formula in library.items()}
+        names = list(library) * self.repeats
+        random.Random(1).shuffle(names)
+        with concurrent.futures.ThreadPoolExecutor(self.threads) as pool:
+            results = pool.map(lambda name: (name, evaluateFormula(library[name])), names)
+            for name,result in results:
+                self.assertEqual(result, serial[name], name)
+
+@unittest.skipUnless(pyparsing, "pyparsing is not installed")
+class ParserTest(unittest.TestCase):
+    extra = ["2^3^2", "-2^2", "--t", "-+-t", "a-b-c", "a/b/c*d", "-sin(-t)^-2", ".5*t", "1.e3", "1e-3+t",
+             "2.5E+2", "pi*PI*Pi", "e^E", "exp(1)", "epsilon", "pie", "hypot(1,2,t)", "sum(1)", "f(g(t,1),-2)",
+             "ternary(lt(t,1),t,-t)", "(((t)))", "d1_$x", " 1 +\t2 ", "", "1+", "(t", "t)", "sin()", "2 3",
+             "1..2", "*t", "t+-1", "a-(-b)", "3-2-1^-t", "1e", "_t", "1,2"]
+
+    def parseBoth(self, s):
+        '''(FormulaParser result, pyparsing result), each the rpn stack or "error"'''
+        try:
+            new = PC.parseFormula(s)
+        except ValueError:
+            new = "error"
+        exprStack = []
+        try:
+            with warnings.catch_warnings(): #the names used before pyparsing 3, kept as they were
+                warnings.simplefilter("ignore", DeprecationWarning)
+                pyparsingBNF(exprStack).parseString(s, parseAll=True)
+            old = exprStack
+        except pyparsing.ParseBaseException:
+            old = "error"
+        return new, old
+
+    def testLibraryFormulas(self):
+        '''every formula in the library parses to the same rpn stack as with the pyparsing grammar'''
+        for name,formula in benchmark.formulaLibrary().items():
+            for source in [formula[k] for k in ("a","b","c","X","Y","Z","t_min","t_max","interval")] + formula["d"]:
+                s = benchmark.stripComments(source)
+                new, old = self.parseBoth(s)
+                self.assertEqual(new, old, f"{name}: {s}")
+
+    def testExpressions(self):
+        '''the same rpn stack, or the same failure, for expressions exercising the grammar'''
+        for s in self.extra:
+            new, old = self.parseBoth(s)
+            self.assertEqual(new, old, repr(s))
+
+class EvaluatorTest(unittest.TestCase):
+    '''evaluateProgram() gives the same values, or the same exceptions, as the recursive evaluate_stack()'''
+    vars = {"a":1.5, "b":-2, "c":0.25, "d":3, "t":0.7, "X":0, "Y":0, "Z":0, "f":2, "d1_$x":4}
+
+    def evaluateBoth(self, program, vars):
+        return outcome(PC.evaluateProgram, program, vars), outcome(PC.evaluate_stack, list(program), dict(vars))
+
+    def testLibraryFormulas(self):
+        for name,formula in benchmark.formulaLibrary().items():
+            curve, fp, programs, constants, graph, tvals = benchmark.prepare(formula)
+            vars = {"a":0, "b":0, "c":0, "X":0, "Y":0, "Z":0, "t":0}
+            vars.update(constants)
+            for t in tvals[:200]:
+                vars["t"] = t
+                for k,value,program in programs:
+                    new, old = self.evaluateBoth(program, vars)
+                    self.assertEqual(new, old, f"{name}: {k} = {value} at t = {t}")
+                    vars[k] = PC.evaluateProgram(program, vars)
+
+    def testExpressions(self):
+        for s in ParserTest.extra + ["factorial(5)/median(1,t,3)", "ternary(0,1/0,2)", "sqrt(-t)", "2^0.5^2"]:
+            try:
+                program = PC.compileFormula(s)
+            except Exception:
+                continue #the parser tests cover these
+            new, old = self.evaluateBoth(program, self.vars)
+            self.assertEqual(new, old, repr(s))
+
+    def testVariableNamedLikeFunction(self):
+        '''a variable with the name of a function is used as the variable, as evaluate_stack() did'''
+        for s in ["sin(t)+sin", "2*cos(t,1)", "log(t)"]:
+            program = PC.compileFormula(s)
+            for vars in [dict(self.vars, sin=5.0, cos=-1.0, log=3.0), self.vars]:
+                new, old = self.evaluateBoth(program, vars)
+                self.assertEqual(new, old, f"{s} with {vars}")
+
+    def testLongPolynomial(self):
+        '''polynomial fits with hundreds of terms reached the recursion limit of evaluate_stack()'''
+        coefficients = [(-1)**n / (n+1) for n in range(2000)]
+        program = PC.compileFormula("+".join(f"{c!r}*t^{n}" for n,c in enumerate(coefficients)))
+        t = 0.9
+        limit = sys.getrecursionlimit()
+        try:
+            sys.setrecursionlimit(max(limit, 10000)) #so evaluate_stack() can be compared at all
+            new, old = self.evaluateBoth(program, {"t":t})
+        finally:
+            sys.setrecursionlimit(limit)
+        self.assertEqual(new, old)
+        self.assertAlmostEqual(PC.evaluateProgram(program, {"t":t}), sum(c*t**n for n,c in enumerate(coefficients)))
+        self.assertEqual(outcome(PC.evaluate_stack, list(program), {"t":t}), "RecursionError")
+
+@unittest.skipUnless(PC.np is not None, "numpy is not installed")
+class VectorizeTest(unittest.TestCase):
+    '''sampleVectorized() gives the same points as sampleGraph() and sampleScalar(), or None when a
+    sample fails so that the failures are reported by the scalar path'''
+    extra = {"int64 overflow":"(lt(t,2)+1)^70", "floordiv by zero":"floordiv(1,lt(t,0))+t",
+             "mod by zero":"mod(1,lt(t,0))+t", "domain error":"sqrt(t-0.5)",
+             "no array form":"median(t,1,2)*t+mode(1,1,t)",
+             "no array form on floats":"factorial(floor(t+3))*t"} #floor() of an array gives floats
+    scalarOnly = ["no array form on floats"]
+
+    def testSamePoints(self):
+        library = benchmark.formulaLibrary()
+        formulas = dict(library)
+        formulas.update({name:dict(library["ellipse"], X=X) for name,X in self.extra.items()})
+        points = lambda matriz: [repr(tuple(point)) for point in matriz]
+        for name,formula in formulas.items():
+            curve, fp, programs, constants, graph, tvals = benchmark.prepare(formula)
+            errors = PC.SampleErrors()
+            generated = curve.sampleGraph(graph, tvals, constants, None, errors)
+            scalar = curve.sampleScalar(programs, tvals, constants, None, PC.SampleErrors())
+            self.assertEqual(points(generated), points(scalar), name)
+            vectorized = curve.sampleVectorized(graph, tvals, constants)
+            if errors.count or name in self.scalarOnly:
+                self.assertIsNone(vectorized, name)
+            else:
+                self.assertEqual(points(vectorized), points(generated), name)
+
+class DerivativeTest(unittest.TestCase):
+    '''the derivatives from FormulaGraph.makeFunction(1) and (2), and the dfn and d2fn tables, agree with
+    central differences'''
+    h = 1e-5
+    tolerance = 1e-6 #relative to the derivative, or absolute if it is less than 1
+    extra = {"powers and variadics":dict(X="t^3 + 2^t + t^t + (t+1)^(t/2)",
+                                         Y="log(t+2,t+3)+atan2(t,2*t+1)+hypot(t,t*t,2)+log(t+1)",
+                                         Z="mod(t,0.7)+prod(t,t,2,t)+stdev(t,t*t,3)+gmean(t+1,2*t)+hmean(t+1,t*3)"),
+             "variables and branches":dict(a="sin(t)", b="a*a/(t+2)", c="b^2", d=["c/a","-d1+t"], X="c - a*d2",
+                                           Y="-b + abs(t-1)/t", Z="ternary(lt(t,1),t*t,2*t)+multiply(t,sqrt(t))+tan(t/3)+atan(t)+asinh(t)+exp(t/4)+cosh(t/5)+tanh(t)",
+                                           t_min="0.05", t_max="3")}
+    args = {"acosh":(1.7,), "interval":(0.2,0.5,0.37), "isclosetol":(0.37,0.61,0.01), "ternary":(0.37,0.61,0.2),
+            "log":(0.37,1.9), "any":(0.37,0.0,0.61), "all":(0.37,0.61,0.2)}
+
+    def assertClose(self, value, expected, message):
+        self.assertLessEqual(abs(value-expected), self.tolerance*max(1.0,abs(expected)), message)
+
+    def testFormulas(self):
+        library = benchmark.formulaLibrary()
+        formulas = dict(library)
+        formulas.update({name:{**library["helix"], "a":"0", "b":"0", "c":"0", "d":[], **changes} for name,changes in self.extra.items()})
+        h = self.h
+        for name,formula in formulas.items():
+            curve, fp, programs, constants, graph, tvals = benchmark.prepare(formula)
+            first, second, branches = graph.makeFunction(1), graph.makeFunction(2), graph.makeFunction(branches=True)
+            for t in tvals[1:-1:max(1,len(tvals)//50)]:
+                if branches(t-h)[3] != branches(t+h)[3]:
+                    continue #a step or corner, where there is no derivative
+                values, below, above = second(t), first(t-h), first(t+h)
+                self.assertEqual(tuple(values[:6]), tuple(first(t)), f"{name} at t = {t}")
+                for k in range(3):
+                    self.assertClose(values[3+k], (above[k]-below[k])/(2*h), f"{name}: d{'XYZ'[k]}/dt at t = {t}")
+                    self.assertClose(values[6+k], (above[3+k]-below[3+k])/(2*h), f"{name}: d2{'XYZ'[k]}/dt2 at t = {t}")
+
+    def testTables(self):
+        '''each partial derivative in dfn and each second partial derivative in d2fn'''
+        h = self.h
+        for op in sorted(PC.dfn):
+            args = self.args.get(op)
+            if args is None: #as many of 0.37, 0.61, 0.2 as the function accepts
+                for n in (3,2,1):
+                    try:
+                        PC.fn[op](*(0.37,0.61,0.2)[:n])
+                        args = (0.37,0.61,0.2)[:n]
+                        break
+                    except TypeError:
+                        pass
+            shifted = lambda i, d: args[:i] + (args[i]+d,) + args[i+1:]
+            partials = PC.dfn[op](*args)
+            hessian = PC.d2fn[op](*args)
+            self.assertEqual(len(partials), len(args), op)
+            for i in range(len(args)):
+                self.assertClose(partials[i], (PC.fn[op](*shifted(i,h))-PC.fn[op](*shifted(i,-h)))/(2*h), f"d{op}/da{i}")
+                above, below = PC.dfn[op](*shifted(i,h)), PC.dfn[op](*shifted(i,-h))
+                for j in range(len(args)):
+                    self.assertClose(hessian[j][i], (above[j]-below[j])/(2*h), f"d2{op}/da{j}da{i}")
+
+    def testCurvature(self):
+        '''the curvature of a helix, a/(a^2+b^2), and of an ellipse, a/b^2 and b/a^2 at the ends of its axes'''
+        library = benchmark.formulaLibrary()
+        helix = benchmark.FeatureStandIn(dict(library["helix"], a="3", b="2", c="0", d=[], X="a*cos(t)", Y="a*sin(t)", Z="b*t"))
+        curve = PC.Curve.__new__(PC.Curve)
+        for kappa in curve.curvature(helix, [0.0, 1.0, 2.0]):
+            self.assertAlmostEqual(kappa, 3/13)
+        ellipse = benchmark.FeatureStandIn(dict(library["helix"], a="5", b="2", c="0", d=[], X="a*cos(t)", Y="b*sin(t)", Z="0"))
+        for kappa,expected in zip(curve.curvature(ellipse, [0.0, math.pi/2]), [5/4, 2/25]):
+            self.assertAlmostEqual(kappa, expected)
+
+if __name__ == "__main__":
+    unittest.main()